@@ -1,16 +1,32 @@
+import startup_profile  # first, so it can time the imports below (STARTUP_PROFILE=1)
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import dash_daq as daq
 import pandas as pd
-import numpy as np
+import os
+from flask import jsonify
 from datetime import datetime
 from datetime import date
 from dateutil.relativedelta import relativedelta
 from configparser import ConfigParser
+from types import SimpleNamespace
+from covid_index import CovidIndex
+from covid_series import line_traces
+from covid_rollup import Rollups
+from covid_map import MapLayer
+from covid_rank import RankIndex
+from figure_cache import FigureCache
+from covid_dataset import LiveDataset
+import covid_schema
+import covid_analytics
+from covid_schema import date_str, date_strings, date_value
+import covid_memory
+import covid_metrics
 
 '''
 ===========
@@ -26,42 +42,41 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.COSMO],
                 ]
                 )
 server = app.server
+covid_metrics.init_app(server)  # callback timings at /metrics
 app.title = 'UK Covid-19'
 
 config = ConfigParser()
 config.read('config.ini')
 mapbox_access_token = config['mapbox']['secret_token']
 
-'''
-================
-READ EXCEL FILES
-================
-'''
-
-# df = pd.read_excel('covid_data.xlsx')
-# df_tot = pd.read_excel('covid_totals.xlsx')
-
-df = pd.read_excel('https://github.com/waiky8/ukcovid-19/blob/main/covid_data.xlsx?raw=true')
-df_tot = pd.read_excel('https://github.com/waiky8/ukcovid-19/blob/main/covid_totals.xlsx?raw=true')
-
 '''
 ======================
 PARAMETERS & VARIABLES
 ======================
 '''
 
-# date_min = '2020-08-12'  # data available from this date
-date_max = df['date'].max()
+startup_mode = os.environ.get('COVID_STARTUP', 'preload')
 
+# date_min = '2020-08-12'  # data available from this date
 days_data = 28
 days_data_less_1 = 27
 
-date_min = datetime.strptime(date_max, '%Y-%m-%d') + relativedelta(days=-days_data)  # 14 day's data
-date_min_sel = datetime.strptime(date_max, '%Y-%m-%d') + relativedelta(days=-days_data_less_1)  # minimum date calendar select
-df = df[df['date'] >= str(date_min)]
-df_tot = df_tot[df_tot['date'] >= str(date_min)]
+# time span of the line charts (days, 0 = full history); covid_rollup picks daily / weekly / monthly points
+span_options = [
+    {'label': '28 days', 'value': days_data},
+    {'label': '3 months', 'value': 91},
+    {'label': '1 year', 'value': 365},
+    {'label': 'All', 'value': 0}
+]
+resolution_titles = {'daily': '', 'weekly': ' (weekly average)', 'monthly': ' (monthly average)'}
 
 marker_calc_size = 50  # used to (dynamically) calculate marker size on map
+metrics = [  # ranked per date for the map and bar chart; also the map hover values, in hovertemplate order
+    'newCasesByPublishDate',
+    'newDeaths28DaysByPublishDate',
+    'cumCasesByPublishDate',
+    'cumDeaths28DaysByPublishDate'
+]
 topn = 10
 chart_h = 360
 fontsize = 15
@@ -75,301 +90,496 @@ col_3 = 'lightseagreen'
 col_4 = 'indianred'
 
 '''
-===================
-DASH LAYOUT SECTION
-===================
+=============================================
+PRE-COMPUTE TOTALS CHART & SUMMARY (PER LOAD)
+=============================================
 '''
 
-app.layout = html.Div(
-    [
-        html.Div(
-            [
-                html.H1('UK Covid-19'),
-                html.H3('(by Local Authority - Daily)')
-            ],
-            style={'text-align': 'center', 'font-weight': 'bold'}
-        ),
 
-        html.Br(),
-
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                html.P('Select Date (last ' + str(days_data) + ' days):'),
-
-                                dcc.DatePickerSingle(
-                                    id='date_picker',
-                                    clearable=True,
-                                    with_portal=True,
-                                    date=date_max,
-                                    display_format='MMM D, YYYY',
-                                    day_size=50,
-                                    initial_visible_month=date_max,
-                                    min_date_allowed=date_min_sel,
-                                    max_date_allowed=date_max
-                                ),
-
-                                html.Br(), html.Br(),
-
-                                dcc.Dropdown(
-                                    id='locauth_drop',
-                                    options=[{'label': i, 'value': i} for i in sorted(df['areaName'].unique())],
-                                    multi=True,
-                                    placeholder='Local Authority (Mutli-Select)',
-                                    style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
-                                )
-                            ], style={'padding': '0px 10px 0px 10px'}
-                        ),
-
-                        html.Br(),
-
-                        html.Div(
-                            [
-                                dbc.Row(
-                                    [
-                                        dbc.Col(
-                                            [
-                                                html.P('Cumulative')
-                                            ], className='col-3'
+def build_tot_chart(tot_rollups, span):
+    # read from the pre-aggregated totals at the resolution that suits the span
+    res, x, tot_cases = tot_rollups.total(span)
 
-                                        ),
+    fig4 = go.Figure()
+    fig4.update_layout(
+        title='<b>UK Daily Cases</b>' + resolution_titles[res],
+        title_font_color=textcol,
+        font_color=textcol,
+        font_size=fontsize,
+        plot_bgcolor=bgcol_2,
+        height=chart_h,
+        margin=dict(l=0, r=0, t=50, b=0),
+        showlegend=False,
+        xaxis={
+            'title': '',
+            'tickangle': 0,
+            'showgrid': False,
+            'fixedrange': True
+        },
+        yaxis={
+            'title': '',
+            'showgrid': False,
+            'zeroline': False,
+            'fixedrange': True
+        },
+        hovermode='x'
+    )
 
-                                        dbc.Col(
-                                            [
-                                                daq.BooleanSwitch(
-                                                    id='data_type',
-                                                    on=True
-                                                )
-                                            ], className='col-3'
-                                        ),
+    fig4.add_trace(
+        go.Scatter(
+            x=x,
+            y=tot_cases,
+            fill='tonexty',
+            fillcolor=col_1,
+            mode='none',
+            name='Cases',
+            showlegend=False,
+            hovertemplate=None
+        )
+    )
 
-                                        dbc.Col(
-                                            [
-                                                html.P('Daily')
-                                            ], className='col-3'
-
-                                        ),
-                                    ]
-                                )
-                            ], style={'padding': '0px 10px 0px 10px'}
-                        ),
-
-                        html.Div(
-                            [
-                                dbc.Row(
-                                    [
-                                        dbc.Col(
-                                            [
-                                                html.P('Deaths')
-                                            ], className='col-3'
+    return fig4.to_dict()
 
-                                        ),
 
-                                        dbc.Col(
-                                            [
-                                                daq.BooleanSwitch(
-                                                    id='cases_deaths_switch',
-                                                    on=True
-                                                )
-                                            ], className='col-3'
-                                        ),
+def build_summary(df_tot):
+    # date -> formatted (new cases, new deaths, total cases, total deaths)
+    cols = [
+        'newCasesByPublishDate',
+        'newDeaths28DaysByPublishDate',
+        'cumCasesByPublishDate',
+        'cumDeaths28DaysByPublishDate'
+    ]
 
-                                        dbc.Col(
-                                            [
-                                                html.P('Cases')
-                                            ], className='col-3'
-                                        )
-                                    ]
-                                )
-                            ], style={'padding': '0px 10px 0px 10px'}
-                        ),
-                    ], style={'background': bgcol_2}
-                ),
-            ], style={'padding': '0px 30px 0px 30px'}
-        ),
+    df1 = df_tot.drop_duplicates(subset=['date'], keep='last').set_index('date')[cols]
 
-        html.Br(), html.Br(),
+    return {
+        dt: tuple('-' if pd.isna(v) else format(int(v), ',d') for v in r)
+        for dt, r in zip(date_strings(df1.index.values), df1.astype(object).values)
+    }
 
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Br(),
 
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    dbc.Card(
-                                        [
-                                            html.H4('New Cases', className='card-title'),
-                                            html.H3(
-                                                id='new_cases',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
-                                            )
-                                        ],
-                                        style={
-                                            'color': bgcol_1,
-                                            'background': col_1,
-                                            'text-align': 'center'
-                                        }
-                                    )
-                                ),
+'''
+=============================
+BUILD DATA VERSION (PER LOAD)
+=============================
+'''
 
-                                dbc.Col(
-                                    dbc.Card(
-                                        [
-                                            html.H4('New Deaths', className='card-title'),
-                                            html.H3(
-                                                id='new_deaths',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
-                                            )
-                                        ],
-                                        style={
-                                            'color': bgcol_1,
-                                            'background': col_2,
-                                            'text-align': 'center'
-                                        }
+
+def build_data(frames, version, cases_rollups=None, tot_rollups=None):
+    # everything the callbacks read, built off to the side and swapped in whole by covid_data
+    df = frames['daily']
+    df_tot = frames['totals']
+
+    # full history (not just the window below) at daily, weekly and monthly resolution for the line charts
+    with startup_profile.phase('rollups'):
+        cases_rollups = cases_rollups or Rollups(df, 'newCasesByPublishDate')
+        tot_rollups = tot_rollups or Rollups(df_tot, 'newCasesByPublishDate')
+
+    date_max = date_str(df['date'].max())
+    date_min = datetime.strptime(date_max, '%Y-%m-%d') + relativedelta(days=-days_data)  # 14 day's data
+    date_min_sel = datetime.strptime(date_max, '%Y-%m-%d') + relativedelta(days=-days_data_less_1)  # minimum date calendar select
+
+    # frames are sorted by date, so the window is a slice (a view - no copy of the shared snapshot)
+    date_from = (date_min + relativedelta(days=1)).strftime('%Y-%m-%d')
+    lookback_from = (date_min + relativedelta(days=1 - covid_analytics.lookback)).strftime('%Y-%m-%d')
+
+    # rolling / growth figures look back before the window, so they are added to the lookback days first
+    with startup_profile.phase('analytics'):
+        df = df.iloc[df['date'].searchsorted(date_value(df['date'], lookback_from)):]
+        df = covid_analytics.add_analytics(df, covid_analytics.load_population())
+
+    df = df.iloc[df['date'].searchsorted(date_value(df['date'], date_from)):]
+    df_tot = df_tot.iloc[df_tot['date'].searchsorted(date_value(df_tot['date'], date_from)):]
+
+    # date -> row range and area -> row positions, built once so callbacks slice instead of scanning
+    with startup_profile.phase('index'):
+        df_index = CovidIndex(df, presorted=True)
+        map_layer = MapLayer(df_index, metrics, covid_analytics.analytics_formats)
+        ranks = RankIndex(df_index, metrics)
+
+    with startup_profile.phase('totals chart + summary'):
+        tot_chart = build_tot_chart(tot_rollups, days_data)
+        summary = build_summary(df_tot)
+
+    return SimpleNamespace(
+        version=version,
+        frames=frames,  # full history, mapped from the snapshot
+        df_index=df_index,
+        cases_rollups=cases_rollups,
+        tot_rollups=tot_rollups,
+        map_layer=map_layer,
+        ranks=ranks,
+        df_tot=df_tot,
+        date_max=date_max,
+        date_min_sel=date_min_sel,
+        area_options=[{'label': i, 'value': i} for i in df_index.areas()],
+        tot_chart=tot_chart,
+        summary=summary
+    )
+
+
+def extend_data(data, frames, version, start):
+    # new days only appended: the rollups are extended with the new rows rather than rebuilt from the
+    # full history; the rest only covers the window, so it is rebuilt as on a load
+    return build_data(
+        frames,
+        version,
+        cases_rollups=data.cases_rollups.extended(frames['daily'].iloc[start['daily']:]),
+        tot_rollups=data.tot_rollups.extended(frames['totals'].iloc[start['totals']:])
+    )
+
+
+'''
+==========================
+READ LOCAL COVID SNAPSHOTS
+==========================
+'''
+
+# figures shared between users, dropped when new data is loaded
+figure_cache = FigureCache(max_items=256)
+
+# loaded once in the gunicorn master (--preload) so forked workers share the frames,
+# then each worker swaps in newly loaded days between requests
+covid_data = LiveDataset(build_data, prepare=covid_schema.apply_schema, extend=extend_data)
+covid_data.listeners.append(lambda data: figure_cache.set_version(data.version))
+
+# COVID_STARTUP=preload (default): load and pre-compute now, in the gunicorn master
+# COVID_STARTUP=lazy: bind straight away and load on the first request in each worker
+if startup_mode == 'preload':
+    covid_memory.log_memory('before data load')
+    with startup_profile.phase('data load (total)'):
+        covid_data.load()
+    covid_memory.log_memory('after data load')
+
+else:
+    def report_deferred_load(data):
+        # once, after the first request in this worker has loaded the data (app.py was reported before it)
+        covid_data.listeners.remove(report_deferred_load)
+        startup_profile.report('app.py (deferred data load)')
+
+    covid_data.listeners.append(report_deferred_load)
+
+
+@server.before_request
+def reload_data():
+    covid_data.ensure()
+    covid_data.refresh()
+
+
+@server.route('/memory')
+def memory():
+    # resident memory of the worker serving this request
+    return jsonify(pid=os.getpid(), **covid_memory.memory_usage())
+
+
+'''
+===================
+DASH LAYOUT SECTION
+===================
+'''
+
+
+def serve_layout():
+    # called per page load so the date range and authority list follow reloaded data
+    data = covid_data.ensure()
+
+    return html.Div(
+        [
+            html.Div(
+                [
+                    html.H1('UK Covid-19'),
+                    html.H3('(by Local Authority - Daily)')
+                ],
+                style={'text-align': 'center', 'font-weight': 'bold'}
+            ),
+
+            html.Br(),
+
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.P('Select Date (last ' + str(days_data) + ' days):'),
+
+                                    dcc.DatePickerSingle(
+                                        id='date_picker',
+                                        clearable=True,
+                                        with_portal=True,
+                                        date=data.date_max,
+                                        display_format='MMM D, YYYY',
+                                        day_size=50,
+                                        initial_visible_month=data.date_max,
+                                        min_date_allowed=data.date_min_sel,
+                                        max_date_allowed=data.date_max
+                                    ),
+
+                                    html.Br(), html.Br(),
+
+                                    dcc.Dropdown(
+                                        id='locauth_drop',
+                                        options=data.area_options,
+                                        multi=True,
+                                        placeholder='Local Authority (Mutli-Select)',
+                                        style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
                                     )
-                                )
-                            ], style={'padding': '0px 10px 0px 10px'}
-                        ),
+                                ], style={'padding': '0px 10px 0px 10px'}
+                            ),
 
-                        html.Br(),
+                            html.Br(),
 
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    dbc.Card(
+                            html.Div(
+                                [
+                                    dbc.Row(
                                         [
-                                            html.H4('Total Cases', className='card-title'),
-                                            html.H3(
-                                                id='total_cases',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
-                                            )
-                                        ],
-                                        style={
-                                            'color': bgcol_1,
-                                            'background': col_3,
-                                            'text-align': 'center'
-                                        }
+                                            dbc.Col(
+                                                [
+                                                    html.P('Cumulative')
+                                                ], className='col-3'
+
+                                            ),
+
+                                            dbc.Col(
+                                                [
+                                                    daq.BooleanSwitch(
+                                                        id='data_type',
+                                                        on=True
+                                                    )
+                                                ], className='col-3'
+                                            ),
+
+                                            dbc.Col(
+                                                [
+                                                    html.P('Daily')
+                                                ], className='col-3'
+
+                                            ),
+                                        ]
                                     )
-                                ),
+                                ], style={'padding': '0px 10px 0px 10px'}
+                            ),
 
-                                dbc.Col(
-                                    dbc.Card(
+                            html.Div(
+                                [
+                                    dbc.Row(
                                         [
-                                            html.H4('Total Deaths', className='card-title'),
-                                            html.H3(
-                                                id='total_deaths',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
+                                            dbc.Col(
+                                                [
+                                                    html.P('Deaths')
+                                                ], className='col-3'
+
+                                            ),
+
+                                            dbc.Col(
+                                                [
+                                                    daq.BooleanSwitch(
+                                                        id='cases_deaths_switch',
+                                                        on=True
+                                                    )
+                                                ], className='col-3'
+                                            ),
+
+                                            dbc.Col(
+                                                [
+                                                    html.P('Cases')
+                                                ], className='col-3'
                                             )
-                                        ],
-                                        style={
-                                            'color': bgcol_1,
-                                            'background': col_4,
-                                            'text-align': 'center'
-                                        }
+                                        ]
                                     )
-                                )
-                            ], style={'padding': '0px 10px 0px 10px'}
-                        ),
+                                ], style={'padding': '0px 10px 0px 10px'}
+                            ),
+                        ], style={'background': bgcol_2}
+                    ),
+                ], style={'padding': '0px 30px 0px 30px'}
+            ),
 
-                        html.Br()
-                    ], style={'background': bgcol_2}
-                )
-            ], style={'padding': '0px 30px 0px 30px'}
-        ),
+            html.Br(), html.Br(),
 
-        html.Br(), html.Br(),
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Br(),
 
-        html.Div(
-            dcc.Loading(
-                dcc.Graph(
-                    id='covid_map',
-                    figure={},
-                    config={'displayModeBar': False}
-                )
-            ), style={'padding': '0px 20px 0px 20px'}
-        ),
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        dbc.Card(
+                                            [
+                                                html.H4('New Cases', className='card-title'),
+                                                html.H3(
+                                                    id='new_cases',
+                                                    className='card-value',
+                                                    style={'font-weight': 'bold'}
+                                                )
+                                            ],
+                                            style={
+                                                'color': bgcol_1,
+                                                'background': col_1,
+                                                'text-align': 'center'
+                                            }
+                                        )
+                                    ),
 
-        html.Br(), html.Br(),
+                                    dbc.Col(
+                                        dbc.Card(
+                                            [
+                                                html.H4('New Deaths', className='card-title'),
+                                                html.H3(
+                                                    id='new_deaths',
+                                                    className='card-value',
+                                                    style={'font-weight': 'bold'}
+                                                )
+                                            ],
+                                            style={
+                                                'color': bgcol_1,
+                                                'background': col_2,
+                                                'text-align': 'center'
+                                            }
+                                        )
+                                    )
+                                ], style={'padding': '0px 10px 0px 10px'}
+                            ),
+
+                            html.Br(),
+
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        dbc.Card(
+                                            [
+                                                html.H4('Total Cases', className='card-title'),
+                                                html.H3(
+                                                    id='total_cases',
+                                                    className='card-value',
+                                                    style={'font-weight': 'bold'}
+                                                )
+                                            ],
+                                            style={
+                                                'color': bgcol_1,
+                                                'background': col_3,
+                                                'text-align': 'center'
+                                            }
+                                        )
+                                    ),
+
+                                    dbc.Col(
+                                        dbc.Card(
+                                            [
+                                                html.H4('Total Deaths', className='card-title'),
+                                                html.H3(
+                                                    id='total_deaths',
+                                                    className='card-value',
+                                                    style={'font-weight': 'bold'}
+                                                )
+                                            ],
+                                            style={
+                                                'color': bgcol_1,
+                                                'background': col_4,
+                                                'text-align': 'center'
+                                            }
+                                        )
+                                    )
+                                ], style={'padding': '0px 10px 0px 10px'}
+                            ),
+
+                            html.Br()
+                        ], style={'background': bgcol_2}
+                    )
+                ], style={'padding': '0px 30px 0px 30px'}
+            ),
+
+            html.Br(), html.Br(),
 
-        html.Div(
-            [
+            html.Div(
                 dcc.Loading(
                     dcc.Graph(
-                        id='chart1',
+                        id='covid_map',
                         figure={},
                         config={'displayModeBar': False}
-                    ), className='col-6'
-                )
-            ], style={'padding': '0px 20px 0px 20px'}
-        ),
+                    )
+                ), style={'padding': '0px 20px 0px 20px'}
+            ),
 
-        html.Br(), html.Br(),
+            html.Br(), html.Br(),
+
+            html.Div(
+                [
+                    dcc.Loading(
+                        dcc.Graph(
+                            id='chart1',
+                            figure={},
+                            config={'displayModeBar': False}
+                        ), className='col-6'
+                    )
+                ], style={'padding': '0px 20px 0px 20px'}
+            ),
 
-        html.Div(
-            html.P("*Defaults to 'Sheffield' if no local authority selected"),
-            style={'font-style': 'italic', 'padding': '0px 20px 0px 20px'}
-        ),
+            html.Br(), html.Br(),
 
-        html.Div(
-            dcc.Loading(
-                dcc.Graph(
-                    id='chart3',
-                    figure={},
-                    config={'displayModeBar': False}
-                )
-            ), style={'padding': '0px 20px 0px 20px'}
-        ),
+            html.Div(
+                html.P("*Defaults to 'Sheffield' if no local authority selected"),
+                style={'font-style': 'italic', 'padding': '0px 20px 0px 20px'}
+            ),
 
-        html.Br(), html.Br(),
+            html.Div(
+                dcc.RadioItems(
+                    id='span_radio',
+                    options=span_options,
+                    value=days_data,
+                    labelStyle={'display': 'inline-block', 'padding': '0px 10px 0px 0px'}
+                ),
+                style={'padding': '0px 20px 0px 20px'}
+            ),
 
-        html.Div(
-            dcc.Loading(
-                dcc.Graph(
-                    id='chart4',
-                    figure={},
-                    config={'displayModeBar': False}
-                )
-            ), style={'padding': '0px 20px 0px 20px'}
-        ),
+            html.Div(
+                dcc.Loading(
+                    dcc.Graph(
+                        id='chart3',
+                        figure={},
+                        config={'displayModeBar': False}
+                    )
+                ), style={'padding': '0px 20px 0px 20px'}
+            ),
 
-        html.Br(), html.Br(), html.Br(),
+            html.Br(), html.Br(),
 
-        html.Div(
-            html.P(
-                ['Data Source: ',
-                 html.A('GovUK', href='https://coronavirus.data.gov.uk/details/download', target='_blank')
-                 ]
+            html.Div(
+                dcc.Loading(
+                    dcc.Graph(
+                        id='chart4',
+                        figure={},
+                        config={'displayModeBar': False}
+                    )
+                ), style={'padding': '0px 20px 0px 20px'}
             ),
-            style={'padding': '0px 0px 0px 50px'}
-        ),
 
-        html.Div(
-            html.P(
-                ['Code: ',
-                 html.A('Github', href='https://github.com/waiky8/ukcovid-19', target='_blank')
-                 ]
+            html.Br(), html.Br(), html.Br(),
+
+            html.Div(
+                html.P(
+                    ['Data Source: ',
+                     html.A('GovUK', href='https://coronavirus.data.gov.uk/details/download', target='_blank')
+                     ]
+                ),
+                style={'padding': '0px 0px 0px 50px'}
             ),
-            style={'padding': '0px 0px 0px 50px'}
-        ),
 
-        # dummy DIV to trigger totals_timeline callback
-        html.Div(
-            id='dummy',
-            children=[],
-            style={'display': 'none'}
-        )
-    ]
-)
+            html.Div(
+                html.P(
+                    ['Code: ',
+                     html.A('Github', href='https://github.com/waiky8/ukcovid-19', target='_blank')
+                     ]
+                ),
+                style={'padding': '0px 0px 0px 50px'}
+            )
+        ]
+    )
+
+
+app.layout = serve_layout
+
 
 '''
 ================
@@ -387,10 +597,10 @@ CALLBACK FOR MAP
         Input('cases_deaths_switch', 'on')
     ]
 )
+@covid_metrics.instrument('map')
+@figure_cache.memoize('map')
 def return_datatable(selected_date, selected_auth, selected_data, selected_cases):
-    # print(str(datetime.now()), '[1] start update_map...')
-
-    df1 = df[df['date'].isin([selected_date])]
+    data = covid_data.current
 
     if selected_data:
         if selected_cases:
@@ -407,60 +617,35 @@ def return_datatable(selected_date, selected_auth, selected_data, selected_cases
             display = 'cumDeaths28DaysByPublishDate'
             marker_col = col_4
 
-    if selected_auth is None or selected_auth == []:
-        pass
-    else:
-        df1 = df1[df1['areaName'].isin(selected_auth)]
-
-    df1 = df1.sort_values(by=[display], ascending=False)
-    df1['Row'] = df1.reset_index().index
-    df1['Row'] += 1
-
-    lat_mean = pd.to_numeric(df1['Latitude']).mean()
-    lon_mean = pd.to_numeric(df1['Longitude']).mean()
-
-    df1.loc[(pd.isna(df1['newDeaths28DaysByPublishDate'])), 'newDeaths28DaysByPublishDate'] = 0
-    df1.loc[(pd.isna(df1['cumDeaths28DaysByPublishDate'])), 'cumDeaths28DaysByPublishDate'] = 0
-
-    fig = go.Figure(
-        go.Scattermapbox(
-            lat=df1['Latitude'],
-            lon=df1['Longitude'],
-            mode='text+markers',
-            marker={'size': df1[display] * marker_calc_size / df1[display].max(),
-                    'color': marker_col,
-                    },
-            name='',
-            text=df1['areaName'],
-            textposition='top center',
-            customdata=np.stack(
-                (
-                    df1['date'],
-                    df1['newCasesByPublishDate'],
-                    df1['newDeaths28DaysByPublishDate'],
-                    df1['cumCasesByPublishDate'],
-                    df1['cumDeaths28DaysByPublishDate']
-                ),
-                axis=-1
-            ),
-            hovertemplate='<br><b>Date</b>: %{customdata[0]}' + \
-                          '<br><b>Local Authority</b>: %{text}' + \
-                          '<br><b>New Cases</b>: %{customdata[1]:,}' + \
-                          '<br><b>New Deaths</b>: %{customdata[2]:,}' + \
-                          '<br><b>Cumulative Cases</b>: %{customdata[3]:,}' + \
-                          '<br><b>Cumulative Deaths</b>: %{customdata[4]:,}'
-        )
+    # rows for the date in precomputed rank order, largest first
+    pos = data.ranks.select(selected_date, display, selected_auth)
+    covid_metrics.lap('filter')
+
+    # lat/long/names are gathered from the static map layer; only sizes and hover values depend on the inputs
+    trace = data.map_layer.trace(
+        pos,
+        display,
+        marker_col,
+        marker_calc_size,
+        hovertemplate='<br><b>Date</b>: ' + str(selected_date) + \
+                      '<br><b>Local Authority</b>: %{text}' + \
+                      '<br><b>New Cases</b>: %{customdata[0]:,}' + \
+                      '<br><b>New Deaths</b>: %{customdata[1]:,}' + \
+                      '<br><b>Cumulative Cases</b>: %{customdata[2]:,}' + \
+                      '<br><b>Cumulative Deaths</b>: %{customdata[3]:,}' + \
+                      '<br><b>Cases (7 days)</b>: %{customdata[4]}' + \
+                      '<br><b>Rate per 100k (7 days)</b>: %{customdata[5]}' + \
+                      '<br><b>Week on Week</b>: %{customdata[6]}' + \
+                      '<br><b>Doubling Time</b>: %{customdata[7]}'
     )
 
+    fig = go.Figure()
     fig.update_layout(
         hovermode='closest',
         mapbox=dict(
             accesstoken=mapbox_access_token,
             bearing=0,
-            center=dict(
-                lat=lat_mean,
-                lon=lon_mean
-            ),
+            center=data.map_layer.center(pos),
             pitch=0,
             zoom=5,
             style='light'  # satellite, outdoors, streets, dark
@@ -473,7 +658,9 @@ def return_datatable(selected_date, selected_auth, selected_data, selected_cases
         margin=dict(t=0, b=0, l=0, r=0)
     )
 
-    # print(str(datetime.now()), '[1] finish update_map...')
+    fig = fig.to_dict()
+    fig['data'] = [trace]
+    covid_metrics.lap('build')
 
     return fig  # df1.to_dict('records')
 
@@ -494,9 +681,9 @@ CALLBACK FOR BAR CHARTS
         Input('cases_deaths_switch', 'on')
     ]
 )
+@covid_metrics.instrument('bar')
+@figure_cache.memoize('bar')
 def return_bar_charts(selected_date, selected_auth, selected_data, selected_cases):
-    # print(str(datetime.now()), '[2] start update_bar_chart...')
-
     if selected_data:
         if selected_cases:
             display = 'newCasesByPublishDate'
@@ -516,16 +703,13 @@ def return_bar_charts(selected_date, selected_auth, selected_data, selected_case
             title = 'Total Deaths'
             bar_col = col_4
 
-    df1 = df[df['date'].isin([selected_date])]
-
-    if selected_auth is None or selected_auth == []:
-        pass
-    else:
-        df1 = df1[df1['areaName'].isin(selected_auth)]
+    data = covid_data.current
 
     d = datetime.strptime(selected_date, '%Y-%m-%d')
 
-    data_fig = df1.sort_values(by=display, ascending=False)[:topn]
+    # top n read from the precomputed rankings - no sort of the date's rows
+    data_fig = data.df_index.df.iloc[data.ranks.select(selected_date, display, selected_auth, topn)]
+    covid_metrics.lap('filter')
 
     fig = go.Figure(
         go.Bar(
@@ -570,7 +754,7 @@ def return_bar_charts(selected_date, selected_auth, selected_data, selected_case
         hoverinfo='skip'
     )
 
-    # print(str(datetime.now()), '[2] finish update_bar_chart...')
+    covid_metrics.lap('build')
 
     return fig
 
@@ -583,21 +767,27 @@ CALLBACK FOR LOCAL AUTHORITY CHART
 
 @app.callback(
     Output('chart3', 'figure'),
-    Input('locauth_drop', 'value')
+    [
+        Input('locauth_drop', 'value'),
+        Input('span_radio', 'value')
+    ]
 )
-def return_loc_auth_chart(selected_auth):
-    # print(str(datetime.now()), '[3] start update_local_authority_chart...')
+@covid_metrics.instrument('locauth')
+@figure_cache.memoize('locauth')
+def return_loc_auth_chart(selected_auth, selected_span):
+    data = covid_data.current
 
     if selected_auth is None or selected_auth == []:
         locauth_list = ['Sheffield']
-        df1 = df[df['areaName'].isin(locauth_list)]
     else:
-        df1 = df[df['areaName'].isin(selected_auth)]
-        locauth_list = df1['areaName'].unique()
+        locauth_list = selected_auth
+
+    res, x, locauth_list, values = data.cases_rollups.series(locauth_list, selected_span)
+    covid_metrics.lap('filter')
 
     fig3 = go.Figure()
     fig3.update_layout(
-        title='<b>Local Authority Cases</b>',
+        title='<b>Local Authority Cases</b>' + resolution_titles[res],
         title_font_color=textcol,
         font_color=textcol,
         font_size=fontsize,
@@ -625,22 +815,18 @@ def return_loc_auth_chart(selected_auth):
         hovermode='x'
     )
 
-    for la in locauth_list:
-        dfx = df1[df1['areaName'] == la]
-        fig3.add_trace(
-            go.Scatter(
-                x=dfx['date'],
-                y=dfx['newCasesByPublishDate'],
-                mode='lines',
-                name='',
-                text=dfx['areaName'],
-                showlegend=False,
-                customdata=dfx['newCasesByPublishDate'],
-                hovertemplate='<br><b>%{text}</b>: %{customdata}'
-            )
-        )
+    # all selected authorities are sliced from one pre-aggregated date x authority matrix
+    fig3 = fig3.to_dict()
+    fig3['data'] = line_traces(
+        x,
+        values,
+        locauth_list,
+        hovertemplate='<br><b>{area}</b>: %{y}<extra></extra>',
+        named=False,
+        showlegend=False
+    )
 
-    # print(str(datetime.now()), '[3] finish update_local_authority_chart...')
+    covid_metrics.lap('build')
 
     return fig3
 
@@ -653,60 +839,17 @@ CALLBACK FOR TOTALS CHART
 
 @app.callback(
     Output('chart4', 'figure'),
-    Input('dummy', 'children')
+    Input('span_radio', 'value')
 )
-def return_tot_chart(none):
-    date_list = df['date'].unique()
+@covid_metrics.instrument('tot')
+@figure_cache.memoize('tot')
+def return_tot_chart(selected_span):
+    data = covid_data.current
 
-    # print(str(datetime.now()), '[4] start uk_totals_chart...')
+    if selected_span == days_data:
+        return data.tot_chart
 
-    fig4 = go.Figure()
-    fig4.update_layout(
-        title='<b>UK Daily Cases</b>',
-        title_font_color=textcol,
-        font_color=textcol,
-        font_size=fontsize,
-        plot_bgcolor=bgcol_2,
-        height=chart_h,
-        margin=dict(l=0, r=0, t=50, b=0),
-        showlegend=False,
-        xaxis={
-            'title': '',
-            'tickangle': 0,
-            'showgrid': False,
-            'fixedrange': True
-        },
-        yaxis={
-            'title': '',
-            'showgrid': False,
-            'zeroline': False,
-            'fixedrange': True
-        },
-        hovermode='x'
-    )
-
-    tot_cases = []
-    for dt in date_list:
-        dfx = df_tot[df_tot['date'] == dt]
-        tc = dfx['newCasesByPublishDate'].sum()
-        tot_cases.append(tc)
-
-    fig4.add_trace(
-        go.Scatter(
-            x=date_list,
-            y=tot_cases,
-            fill='tonexty',
-            fillcolor=col_1,
-            mode='none',
-            name='Cases',
-            showlegend=False,
-            hovertemplate=None
-        )
-    )
-
-    # print(str(datetime.now()), '[4] finish uk_totals_chart...')
-
-    return fig4
+    return build_tot_chart(data.tot_rollups, selected_span)
 
 
 '''
@@ -725,20 +868,18 @@ CALLBACK FOR SUMMARY BOXES
     ],
     Input('date_picker', 'date')
 )
+@covid_metrics.instrument('summary')
 def return_summary(selected_date):
-    # print(str(datetime.now()), '[5] start update_summary_box...')
-
-    df1 = df_tot[df_tot['date'] == selected_date]
+    summary = covid_data.current.summary
 
-    new_cases = format(int(df1['newCasesByPublishDate']), ',d')
-    new_deaths = format(int(df1['newDeaths28DaysByPublishDate']), ',d')
-    total_cases = format(int(df1['cumCasesByPublishDate']), ',d')
-    total_deaths = format(int(df1['cumDeaths28DaysByPublishDate']), ',d')
+    if selected_date not in summary:
+        raise PreventUpdate
 
-    # print(str(datetime.now()), '[5] finish update_summary_box...')
+    return summary[selected_date]
 
-    return new_cases, new_deaths, total_cases, total_deaths
 
+startup_profile.report('app.py')
+startup_profile.watch_first_response(server)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -3,12 +3,16 @@ import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
 import pandas as pd
-from openpyxl import load_workbook
-import bs4 as bs
+import http.client
 import urllib.request
-import datetime
 from datetime import date
+import covid_store
+import covid_ingest
+import covid_geocode
+import covid_jobs
+import covid_metrics
 
 '''
 ===========
@@ -16,8 +20,8 @@ DATA SOURCE
 ===========
 '''
 
-url_ltla = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=ltla&metric=cumCasesByPublishDate&metric=newCasesByPublishDate&metric=newDeaths28DaysByPublishDate&metric=cumDeaths28DaysByPublishDate&format=csv'
-url_uk = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=overview&metric=cumCasesByPublishDate&metric=newCasesByPublishDate&metric=newDeaths28DaysByPublishDate&metric=cumDeaths28DaysByPublishDate&format=csv'
+url_ltla = covid_ingest.url_ltla
+url_uk = covid_ingest.url_uk
 
 '''
 ===========
@@ -33,20 +37,18 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.COSMO],
                 ]
                 )
 server = app.server
+covid_metrics.init_app(server)  # callback timings at /metrics
 app.title = 'UK Covid-19'
 
 '''
-================
-READ EXCEL FILES
-================
+=====================
+READ COVID DATA STORE
+=====================
 '''
 
-covid_daily_file = 'covid_data.xlsx'
-covid_totals_file = 'covid_totals.xlsx'
 lat_long_file = 'lat_long.xlsx'
 
-df_daily = pd.read_excel(covid_daily_file)
-df_totals = pd.read_excel(covid_totals_file)
+covid_store.ensure_store()
 df_lat_long = pd.read_excel(lat_long_file)
 
 '''
@@ -56,21 +58,16 @@ PARAMETERS & VARIABLES
 '''
 
 date_min = '2020-08-12'  # data available from this date
-date_max = df_daily['date'].max()
-date_today = date.today()
+date_list_daily = covid_store.list_dates('daily')
+date_list_totals = covid_store.list_dates('totals')
 
-date_list_daily = [str(d) for d in df_daily['date'].unique()]
-date_list_totals = [str(d) for d in df_totals['date'].unique()]
+date_max = date_list_daily[-1]
+date_today = date.today()
 
-# following are missing coordinates from doogal website
-coords = [
-    ('Aylesbury Vale', 51.8996278, -1.1193516),
-    ('Chiltern', 51.6788424, -0.7737162),
-    ('South Bucks', 51.5600494, -0.7301907),
-    ('Wycombe', 51.6635175, -0.9501978)
-]
+job_poll_ms = 1000  # how often the page checks on a running load
 
-df_coords = pd.DataFrame(coords, columns=['LA', 'Lat', 'Long'])
+# areaName -> (lat, long), including the coordinates missing from doogal
+coord_lookup = covid_geocode.build_lookup(df_lat_long)
 
 '''
 ===================
@@ -116,22 +113,20 @@ app.layout = html.Div(
                             [
                                 html.Br(),
 
-                                dcc.Loading(
-                                    dbc.Card(
-                                        [
-                                            html.H5('Covid Data', className='card-title'),
-                                            html.H4(
-                                                id='message1',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
-                                            )
-                                        ],
-                                        style={
-                                            'color': 'white',
-                                            'background': 'teal',
-                                            'text-align': 'center'
-                                        }
-                                    )
+                                dbc.Card(
+                                    [
+                                        html.H5('Covid Data', className='card-title'),
+                                        html.H4(
+                                            id='message1',
+                                            className='card-value',
+                                            style={'font-weight': 'bold'}
+                                        )
+                                    ],
+                                    style={
+                                        'color': 'white',
+                                        'background': 'teal',
+                                        'text-align': 'center'
+                                    }
                                 ),
 
                                 html.Br()
@@ -142,22 +137,20 @@ app.layout = html.Div(
                             [
                                 html.Br(),
 
-                                dcc.Loading(
-                                    dbc.Card(
-                                        [
-                                            html.H5('Covid Totals', className='card-title'),
-                                            html.H4(
-                                                id='message2',
-                                                className='card-value',
-                                                style={'font-weight': 'bold'}
-                                            )
-                                        ],
-                                        style={
-                                            'color': 'white',
-                                            'background': 'midnightblue',
-                                            'text-align': 'center'
-                                        }
-                                    )
+                                dbc.Card(
+                                    [
+                                        html.H5('Covid Totals', className='card-title'),
+                                        html.H4(
+                                            id='message2',
+                                            className='card-value',
+                                            style={'font-weight': 'bold'}
+                                        )
+                                    ],
+                                    style={
+                                        'color': 'white',
+                                        'background': 'midnightblue',
+                                        'text-align': 'center'
+                                    }
                                 ),
 
                                 html.Br()
@@ -166,25 +159,36 @@ app.layout = html.Div(
                     ],  # style={'background': 'whitesmoke', 'border-style': 'groove'}
                 )
             ], style={'padding': '0px 10px 0px 10px'}
+        ),
+
+        html.Div(
+            html.P(id='job_progress', className='font-italic'),
+            style={'padding': '0px 10px 0px 10px'}
+        ),
+
+        # polls the background load job until it finishes
+        dcc.Interval(
+            id='job_poll',
+            interval=job_poll_ms,
+            disabled=True
         )
     ]
 )
 
 '''
-======================
-CALLBACK FOR DATA LOAD
-======================
+==================================
+DATA LOAD (RUNS AS BACKGROUND JOB)
+==================================
 '''
 
 
-@app.callback(
-    [Output('message1', 'children'),
-     Output('message2', 'children')
-     ],
-    Input('date_picker', 'date')
-)
-def return_new_data(selected_date):
-    d = datetime.datetime.strptime(selected_date, '%Y-%m-%d')
+# read, geocode or write errors are reported on the dataset's card, so one dataset failing does not stop the other
+load_errors = (urllib.request.URLError, OSError, http.client.HTTPException,
+               pd.errors.EmptyDataError, pd.errors.ParserError, KeyError, ValueError)
+
+
+def load_date(job):
+    selected_date = job.key
 
     '''
     -----------
@@ -193,95 +197,48 @@ def return_new_data(selected_date):
     '''
 
     if selected_date in date_list_daily:
-        message1 = 'Already Uploaded'
+        job.messages['daily'] = 'Already Uploaded'
 
     else:
         url = url_ltla + '&release=' + selected_date
 
         try:
-            print('Processing daily data...')
-            print(str(datetime.datetime.now()), 'step 1 of 3: read ', url)
-            df_load = pd.read_csv(url)
-
-            print(str(datetime.datetime.now()), 'step 2 of 3: extract data for ', d.strftime('%b %d, %Y'))
-            df_load = df_load[df_load['date'] == selected_date]
-
-            df_load['newCasesByPublishDate'].fillna(0, inplace=True)
-            df_load['cumCasesByPublishDate'].fillna(0, inplace=True)
-            df_load['newDeaths28DaysByPublishDate'].fillna(0, inplace=True)
-            df_load['cumDeaths28DaysByPublishDate'].fillna(0, inplace=True)
-
-            '''
-            --------------------
-            LATITUDE & LONGITUDE
-            --------------------
-            '''
-
-            tot_rows = df_load.shape[0]
-            latitude = []
-            longitude = []
-
-            for i, r in enumerate(df_load.itertuples(), start=1):
-                loc_auth = r.areaName
-
-                lat, long = get_coord(loc_auth)
-
-                if lat == '' or long == '':
-                    for c in df_coords.itertuples():
-                        if c.LA == loc_auth:
-                            lat = c.Lat
-                            long = c.Long
-
-                if lat == '' or long == '':
-                    print('*** Not Found ***')
-
-                latitude.append(lat)
-                longitude.append(long)
-
-                print("[", i, "/", tot_rows, "]", loc_auth, lat, long)
-
-            df_load['Latitude'] = latitude
-            df_load['Longitude'] = longitude
-
-            '''
-            --------------
-            WRITE TO EXCEL
-            --------------
-            '''
-
-            print(str(datetime.datetime.now()), 'step 3 of 3: write to covid file...')
-            writer = pd.ExcelWriter(covid_daily_file)
-            writer.book = load_workbook(covid_daily_file)
-            writer.sheets = {ws.title: ws for ws in writer.book.worksheets}
-
-            for sheetname in writer.sheets:
-                df_load.to_excel(
-                    writer,
-                    sheet_name=sheetname,
-                    index=False,
-                    header=False,
-                    startrow=writer.sheets[sheetname].max_row,
-                    columns=
-                    [
-                        'date',
-                        'areaType',
-                        'areaCode',
-                        'areaName',
-                        'cumCasesByPublishDate',
-                        'newCasesByPublishDate',
-                        'newDeaths28DaysByPublishDate',
-                        'cumDeaths28DaysByPublishDate',
-                        'Latitude',
-                        'Longitude'
-                    ]
-                )
-                writer.save()
-                date_list_daily.append(selected_date)
+            with job.timed('daily: read'):
+                df_load = covid_ingest.read_release(url, [selected_date])
+                df_load = covid_ingest.fill_counts(df_load)
+
+            # an empty release (200 with no rows, or 204) has nothing to geocode or store
+            if df_load.empty:
+                job.messages['daily'] = 'Not Available'
+
+            else:
+                '''
+                --------------------
+                LATITUDE & LONGITUDE
+                --------------------
+                '''
 
-            message1 = 'Upload Complete'
+                with job.timed('daily: geocode'):
+                    df_load, not_found = covid_geocode.geocode(df_load, coord_lookup)
+
+                '''
+                -------------------
+                WRITE TO DATA STORE
+                -------------------
+                '''
+
+                with job.timed('daily: write'):
+                    covid_store.write_partition('daily', selected_date, df_load)
+                    date_list_daily.append(selected_date)
+
+                job.messages['daily'] = 'Upload Complete'
 
         except urllib.request.HTTPError:
-            message1 = 'Not Available'
+            job.messages['daily'] = 'Not Available'
+
+        except load_errors as err:  # HTTPError is a URLError, so it is caught above first
+            print('Daily load failed for', selected_date, '-', repr(err))
+            job.messages['daily'] = 'Failed'
 
     '''
     -----------
@@ -290,121 +247,83 @@ def return_new_data(selected_date):
     '''
 
     if selected_date in date_list_totals:
-        message2 = 'Already Uploaded'
+        job.messages['totals'] = 'Already Uploaded'
 
     else:
         url = url_uk + '&release=' + selected_date
 
         try:
-            print('Processing totals data...')
-            print(str(datetime.datetime.now()), 'step 1 of 3: read ', url)
-            df_load = pd.read_csv(url)
-
-            print(str(datetime.datetime.now()), ' step 2 of 3: extract data for ', d.strftime('%b %d, %Y'))
-            df_load = df_load[df_load['date'] == selected_date]
-
-            print(str(datetime.datetime.now()), 'step 3 of 3: write to covid file...')
-            writer = pd.ExcelWriter(covid_totals_file)
-            writer.book = load_workbook(covid_totals_file)
-            writer.sheets = {ws.title: ws for ws in writer.book.worksheets}
-
-            for sheetname in writer.sheets:
-                df_load.to_excel(
-                    writer,
-                    sheet_name=sheetname,
-                    index=False,
-                    header=False,
-                    startrow=writer.sheets[sheetname].max_row,
-                    columns=
-                    [
-                        'date',
-                        'areaType',
-                        'areaCode',
-                        'areaName',
-                        'cumCasesByPublishDate',
-                        'newCasesByPublishDate',
-                        'newDeaths28DaysByPublishDate',
-                        'cumDeaths28DaysByPublishDate'
-                    ]
-                )
-                writer.save()
-                date_list_totals.append(selected_date)
+            with job.timed('totals: read'):
+                df_load = covid_ingest.read_release(url, [selected_date])
 
-            message2 = 'Upload Complete'
+            if df_load.empty:
+                job.messages['totals'] = 'Not Available'
+
+            else:
+                with job.timed('totals: write'):
+                    covid_store.write_partition('totals', selected_date, df_load)
+                    date_list_totals.append(selected_date)
+
+                job.messages['totals'] = 'Upload Complete'
 
         except urllib.request.HTTPError:
-            message2 = 'Not Available'
+            job.messages['totals'] = 'Not Available'
 
-    print(str(datetime.datetime.now()), message1)
-    print(str(datetime.datetime.now()), message2)
+        except load_errors as err:
+            print('Totals load failed for', selected_date, '-', repr(err))
+            job.messages['totals'] = 'Failed'
 
-    return message1, message2
 
+# one worker: loads append to the same store, so run them one after another
+load_queue = covid_jobs.JobQueue(load_date, workers=1)
+load_queue.listeners.append(covid_metrics.record_job)
 
 '''
-========================
-GET LATITUDE & LONGITUDE
-========================
+======================
+CALLBACK FOR DATA LOAD
+======================
 '''
 
 
-def get_coord(loc_auth):
-    lat = long = ''
-
-    if pd.isna(loc_auth):
-        return lat, long
-
-    '''
-    Try to get lat/long from existing data to speed up runtime
-    '''
-
-    # lat = df_daily[df_daily['areaName'] == loc_auth]['Latitude'].values[0]
-    # long = df_daily[df_daily['areaName'] == loc_auth]['Longitude'].values[0]
-    lat = df_lat_long[df_lat_long['areaName'] == loc_auth]['Latitude'].values[0]
-    long = df_lat_long[df_lat_long['areaName'] == loc_auth]['Longitude'].values[0]
-
-    if lat != '':
-        return lat, long
-
-    '''
-    Now try to get lat/long from doogal
-    '''
-
-    if loc_auth == 'Hackney and City of London':
-        loc_auth = 'Hackney'
-
-    if loc_auth == 'Cornwall and Isles of Scilly':
-        loc_auth = 'Cornwall'
-
-    if loc_auth == 'Comhairle nan Eilean Siar':
-        loc_auth = 'Na h-Eileanan Siar'
-
-    url = 'https://www.doogal.co.uk/AdministrativeAreas.php'
-
-    try:
-        source = urllib.request.urlopen(url)
-        soup = bs.BeautifulSoup(source, 'lxml')
-        tables = soup.find_all('table')
+@app.callback(
+    [Output('message1', 'children'),
+     Output('message2', 'children'),
+     Output('job_progress', 'children'),
+     Output('job_poll', 'disabled')
+     ],
+    [Input('date_picker', 'date'),
+     Input('job_poll', 'n_intervals')
+     ]
+)
+@covid_metrics.instrument('new_data')
+def return_new_data(selected_date, n_intervals):
+    if selected_date is None:
+        raise PreventUpdate
+
+    # picking a date queues the load (clicks for a date already queued/running share its job); polling only reads
+    if dash.callback_context.triggered[0]['prop_id'] == 'job_poll.n_intervals':
+        job = load_queue.get(selected_date) or load_queue.submit(selected_date)
+    else:
+        job = load_queue.submit(selected_date)
 
-        for tb in tables:
-            table_rows = tb.find_all('tr')
+    covid_metrics.lap('filter')
 
-            for tr in table_rows:
-                thd = tr.find_all(['th', 'td'])
-                row = [i.text for i in thd]
+    if job.status == 'failed':
+        message1 = message2 = 'Failed'
+    elif job.finished():
+        message1 = job.messages.get('daily', '')
+        message2 = job.messages.get('totals', '')
+    else:
+        message1 = job.messages.get('daily', job.status.title() + '...')
+        message2 = job.messages.get('totals', job.status.title() + '...')
 
-                if not row:
-                    pass
-                else:
-                    if row[0] == loc_auth:
-                        lat = row[2]
-                        long = row[3]
-                        break
+    progress = job.summary()
+    if job.stage:
+        progress = (progress + ', ' if progress else '') + job.stage + '...'
 
-    except urllib.request.HTTPError as err:
-        print('HTTP Error: (local auth ', loc_auth, ')', err.code)
+    covid_metrics.lap('build')
 
-    return lat, long
+    return message1, message2, progress, job.finished()
 
 
 if __name__ == '__main__':
@@ -6,7 +6,13 @@ from dash.dependencies import Input, Output, State
 import dash_table
 from dash_table.Format import Format, Scheme
 import plotly.graph_objects as go
-import pandas as pd
+from types import SimpleNamespace
+from covid_index import CovidIndex
+from covid_msoa import MsoaFeed
+from covid_series import SeriesMatrix
+from covid_table import TableIndex
+from covid_schema import date_str, date_strings
+import covid_metrics
 
 # import bs4 as bs
 # import urllib.request
@@ -25,249 +31,309 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.COSMO],
                 ]
                 )
 server = app.server
+covid_metrics.init_app(server)  # callback timings at /metrics
 app.title = 'UK Covid-19 Local'
 
-'''
-==================================================
-READ DATA FROM GOVUK URL & POSTCODE FROM CSV FILES
-==================================================
-'''
-
-file = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=msoa&metric=newCasesBySpecimenDateRollingSum&metric=newCasesBySpecimenDateRollingRate&metric=newCasesBySpecimenDateChange&metric=newCasesBySpecimenDateChangePercentage&metric=newCasesBySpecimenDateDirection&format=csv'
-
-df = pd.read_csv(file)
-
 '''
 ======================
 PARAMETERS & VARIABLES
 ======================
 '''
-date_max = df['date'].max()
-
 topn = 5  # Number of items to show as 'top x'
 chart_h = 320  # height of charts
 datatable_rows = 10  # rows per page of datatable
 fontsize = 12
 
+direction_arrows = {'UP': '↑', 'DOWN': '↓', 'SAME': '-'}  # '↔'
+
+table_columns = [
+    'areaName',
+    'newCasesBySpecimenDateRollingSum',
+    'newCasesBySpecimenDateDirection',
+    'LtlaName'
+]
+
 textcol = 'dimgrey'
 bgcol_1 = 'white'
 bgcol_2 = 'whitesmoke'
 
+'''
+=======================================
+READ MSOA DATA (CACHED, REFRESHED LIVE)
+=======================================
+
+The GovUK MSOA release is read from the shared disk cache (covid_msoa.py) and
+re-checked in the background, so workers neither download it on boot nor serve
+it stale forever.
+'''
+
+
+def build_data(df):
+    # per date, rows ranked by rolling sum - the datatable order - so a date is a ready-sorted contiguous block
+    df = df.sort_values(
+        by=['date', 'newCasesBySpecimenDateRollingSum'], ascending=[True, False], kind='mergesort'
+    ).reset_index(drop=True)
+
+    # just the datatable columns, with the direction categories relabelled as arrows (no per-row work)
+    table = df[table_columns].copy()
+    table['newCasesBySpecimenDateDirection'] = \
+        table['newCasesBySpecimenDateDirection'].cat.rename_categories(direction_arrows)
+
+    df_index = CovidIndex(df, presorted=True)
+
+    return SimpleNamespace(
+        df=df,
+        df_index=df_index,
+        table_index=TableIndex(df_index, table),
+        cases_series=SeriesMatrix(df_index, 'newCasesBySpecimenDateRollingSum', fill_value=0),
+        date_max=date_str(df['date'].max()),
+        date_options=[{'label': i, 'value': i} for i in sorted(date_strings(df['date'].unique()))],
+        area_options=[{'label': i, 'value': i} for i in df['areaName'].cat.categories],
+        ltla_options=[{'label': i, 'value': i} for i in df['LtlaName'].cat.categories]
+    )
+
+
+msoa_feed = MsoaFeed(build_data)
+msoa_feed.load()
+
+
+@server.before_request
+def refresh_data():
+    msoa_feed.refresh()
+
+
 '''
 ===================
 DASH LAYOUT SECTION
 ===================
 '''
 
-app.layout = html.Div(
-    [
-        html.Div(
-            [
-                html.H3('UK Covid-19'),
-            ],
-            style={'text-align': 'center', 'font-weight': 'bold'}
-        ),
 
-        html.Br(),
-
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Br(),
-
-                        dcc.Dropdown(
-                            id='date_drop',
-                            options=[{'label': i, 'value': i} for i in sorted(df['date'].unique())],
-                            multi=False,
-                            placeholder='Select Date',
-                            value=date_max,
-                            style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
-                        ),
-
-                        html.Br(),
-
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    [
-                                        dcc.Dropdown(
-                                            id='msoa_drop',
-                                            options=[{'label': i, 'value': i} for i in sorted(df['areaName'].unique())],
-                                            multi=True,
-                                            placeholder='Local Area',
-                                            style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
-                                        ),
-                                    ], xs=6, sm=6, md=6, lg=6, xl=6
-                                ),
-
-                                dbc.Col(
-                                    [
-                                        dcc.Dropdown(
-                                            id='ltla_drop',
-                                            options=[{'label': i, 'value': i} for i in sorted(df['LtlaName'].unique())],
-                                            multi=True,
-                                            placeholder='Local Authority',
-                                            style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
-                                        ),
-                                    ], xs=6, sm=6, md=6, lg=6, xl=6
-                                ),
-                            ]
-                        ),
-
-                        html.Br(),
-
-                        # dbc.Row(
-                        #     [
-                        #         dbc.Col(
-                        #             [
-                        #                 dcc.Input(
-                        #                     id='postcode_inp',
-                        #                     # className='col-4',
-                        #                     placeholder='Post Code',
-                        #                     style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
-                        #                 ),
-                        #             ], xs=4, sm=4, md=4, lg=4, xl=4
-                        #         ),
-                        #
-                        #         dbc.Col(
-                        #             [
-                        #                 html.P(id='message', className='col-8'),
-                        #             ], xs=8, sm=8, md=8, lg=8, xl=8
-                        #         ),
-                        #     ]
-                        # ),
-                        #
-                        # html.Br()
-                    ], style={'background': bgcol_2, 'padding': '0px 10px 0px 10px'}
-                )
-            ], style={'padding': '0px 20px 0px 20px'}
-        ),
-
-        html.Br(),
+def serve_layout():
+    # called per page load so the dropdowns follow refreshed data
+    data = msoa_feed.current
+
+    return html.Div(
+        [
+            html.Div(
+                [
+                    html.H3('UK Covid-19'),
+                ],
+                style={'text-align': 'center', 'font-weight': 'bold'}
+            ),
+
+            html.Br(),
+
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Br(),
+
+                            dcc.Dropdown(
+                                id='date_drop',
+                                options=data.date_options,
+                                multi=False,
+                                placeholder='Select Date',
+                                value=data.date_max,
+                                style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
+                            ),
+
+                            html.Br(),
+
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            dcc.Dropdown(
+                                                id='msoa_drop',
+                                                options=data.area_options,
+                                                multi=True,
+                                                placeholder='Local Area',
+                                                style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
+                                            ),
+                                        ], xs=6, sm=6, md=6, lg=6, xl=6
+                                    ),
+
+                                    dbc.Col(
+                                        [
+                                            dcc.Dropdown(
+                                                id='ltla_drop',
+                                                options=data.ltla_options,
+                                                multi=True,
+                                                placeholder='Local Authority',
+                                                style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
+                                            ),
+                                        ], xs=6, sm=6, md=6, lg=6, xl=6
+                                    ),
+                                ]
+                            ),
+
+                            html.Br(),
+
+                            # dbc.Row(
+                            #     [
+                            #         dbc.Col(
+                            #             [
+                            #                 dcc.Input(
+                            #                     id='postcode_inp',
+                            #                     # className='col-4',
+                            #                     placeholder='Post Code',
+                            #                     style={'font-size': fontsize, 'color': 'black', 'background-color': bgcol_1}
+                            #                 ),
+                            #             ], xs=4, sm=4, md=4, lg=4, xl=4
+                            #         ),
+                            #
+                            #         dbc.Col(
+                            #             [
+                            #                 html.P(id='message', className='col-8'),
+                            #             ], xs=8, sm=8, md=8, lg=8, xl=8
+                            #         ),
+                            #     ]
+                            # ),
+                            #
+                            # html.Br()
+                        ], style={'background': bgcol_2, 'padding': '0px 10px 0px 10px'}
+                    )
+                ], style={'padding': '0px 20px 0px 20px'}
+            ),
+
+            html.Br(),
+
+            html.Div(
+                [
+                    dcc.Loading(
+                        dash_table.DataTable(
+                            id='datatable',
+
+                            columns=[
+                                {
+                                    'id': 'areaName',
+                                    'name': 'Local Area',
+                                    'type': 'text'
+                                },
+                                {
+                                    'id': 'newCasesBySpecimenDateRollingSum',
+                                    'name': 'New Cases',
+                                    'type': 'numeric',
+                                    'format': Format(
+                                        precision=0,
+                                        group=',',
+                                        scheme=Scheme.fixed,
+                                        symbol=''
+                                    )
+                                },
+                                {
+                                    'id': 'newCasesBySpecimenDateDirection',
+                                    'name': 'Change',
+                                    'type': 'text'
+                                },
+                                {
+                                    'id': 'LtlaName',
+                                    'name': 'Local Authority',
+                                    'type': 'text'
+                                },
+                            ],
 
-        html.Div(
-            [
-                dcc.Loading(
-                    dash_table.DataTable(
-                        id='datatable',
-
-                        columns=[
-                            {
-                                'id': 'areaName',
-                                'name': 'Local Area',
-                                'type': 'text'
-                            },
-                            {
-                                'id': 'newCasesBySpecimenDateRollingSum',
-                                'name': 'New Cases',
-                                'type': 'numeric',
-                                'format': Format(
-                                    precision=0,
-                                    group=',',
-                                    scheme=Scheme.fixed,
-                                    symbol=''
-                                )
-                            },
-                            {
-                                'id': 'newCasesBySpecimenDateDirection',
-                                'name': 'Change',
-                                'type': 'text'
-                            },
-                            {
-                                'id': 'LtlaName',
-                                'name': 'Local Authority',
-                                'type': 'text'
+                            style_data={
+                                'whiteSpace': 'normal',
+                                'height': 'auto',
+                                'width': '100px',
+                                'maxWidth': '100px',
+                                'minWidth': '100px',
                             },
-                        ],
-
-                        style_data={
-                            'whiteSpace': 'normal',
-                            'height': 'auto',
-                            'width': '100px',
-                            'maxWidth': '100px',
-                            'minWidth': '100px',
-                        },
-
-                        style_cell_conditional=[
-                            {
-                                'if': {
-                                    'column_id': 'areaName'
+
+                            style_cell_conditional=[
+                                {
+                                    'if': {
+                                        'column_id': 'areaName'
+                                    },
+                                    'textAlign': 'left'
                                 },
-                                'textAlign': 'left'
-                            },
-                            {
-                                'if': {
-                                    'column_id': 'LtlaName'
+                                {
+                                    'if': {
+                                        'column_id': 'LtlaName'
+                                    },
+                                    'textAlign': 'left'
                                 },
-                                'textAlign': 'left'
-                            },
-                            {
-                                'if': {
-                                    'column_id': 'newCasesBySpecimenDateDirection'
+                                {
+                                    'if': {
+                                        'column_id': 'newCasesBySpecimenDateDirection'
+                                    },
+                                    'textAlign': 'center'
                                 },
-                                'textAlign': 'center'
+                            ],
+
+                            style_table={'overflowX': 'auto'},
+
+                            style_cell={
+                                'fontSize': 12,
+                                'padding': '0px 5px 0px 5px'
                             },
-                        ],
 
-                        style_table={'overflowX': 'auto'},
+                            # paged, sorted and filtered in return_datatable so only the visible page is sent
+                            page_action='custom',
+                            page_current=0,
+                            page_size=datatable_rows,
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
+                            filter_action='custom',
+                            filter_query='',
+                        )
+                    )
+                ], style={'padding': '0px 20px 0px 20px'}
+            ),
 
-                        style_cell={
-                            'fontSize': 12,
-                            'padding': '0px 5px 0px 5px'
-                        },
+            html.Br(), html.Br(),
 
-                        page_size=datatable_rows,
+            html.Div(
+                dcc.Loading(
+                    dcc.Graph(
+                        id='chart1',
+                        figure={},
+                        config={'displayModeBar': False}
                     )
-                )
-            ], style={'padding': '0px 20px 0px 20px'}
-        ),
+                ), style={'padding': '0px 20px 0px 20px'}
+            ),
+
+            html.Br(),
+
+            html.Div(
+                [
+                    dbc.Row(
+                        [
+                            dbc.Col(
+                                [
+                                    html.P(
+                                        ['Data Source: ',
+                                         html.A('GovUK', href='https://coronavirus.data.gov.uk/details/download',
+                                                target='_blank')
+                                         ], className='font-italic'
+                                    ),
+                                ]
+                            ),
+
+                            dbc.Col(
+                                [
+                                    html.P(
+                                        ['Code: ',
+                                         html.A('Github', href='https://github.com/waiky8/ukcovid-19',
+                                                target='_blank')
+                                         ], className='font-italic text-right'
+                                    ),
+                                ],
+                            ),
+                        ], style={'padding': '0px 20px 0px 20px'}
+                    )
+                ]
+            )
+        ]
+    )
 
-        html.Br(), html.Br(),
 
-        html.Div(
-            dcc.Loading(
-                dcc.Graph(
-                    id='chart1',
-                    figure={},
-                    config={'displayModeBar': False}
-                )
-            ), style={'padding': '0px 20px 0px 20px'}
-        ),
+app.layout = serve_layout
 
-        html.Br(),
-
-        html.Div(
-            [
-                dbc.Row(
-                    [
-                        dbc.Col(
-                            [
-                                html.P(
-                                    ['Data Source: ',
-                                     html.A('GovUK', href='https://coronavirus.data.gov.uk/details/download',
-                                            target='_blank')
-                                     ], className='font-italic'
-                                ),
-                            ]
-                        ),
-
-                        dbc.Col(
-                            [
-                                html.P(
-                                    ['Code: ',
-                                     html.A('Github', href='https://github.com/waiky8/ukcovid-19',
-                                            target='_blank')
-                                     ], className='font-italic text-right'
-                                ),
-                            ],
-                        ),
-                    ], style={'padding': '0px 20px 0px 20px'}
-                )
-            ]
-        )
-    ]
-)
 
 '''
 ======================
@@ -277,39 +343,48 @@ CALLBACK FOR DATATABLE
 
 
 @app.callback(
-    Output('datatable', 'data'),
+    [
+        Output('datatable', 'data'),
+        Output('datatable', 'page_count')
+    ],
     [
         Input('date_drop', 'value'),
         Input('ltla_drop', 'value'),
-        Input('msoa_drop', 'value')
+        Input('msoa_drop', 'value'),
+        Input('datatable', 'page_current'),
+        Input('datatable', 'page_size'),
+        Input('datatable', 'sort_by'),
+        Input('datatable', 'filter_query')
     ]
 )
-def return_datatable(selected_date, selected_ltla, selected_area):
-    df1 = df.copy()
-    df1 = df1[df1['date'].isin([selected_date])]
+@covid_metrics.instrument('datatable')
+def return_datatable(selected_date, selected_ltla, selected_area, page_current, page_size, sort_by, filter_query):
+    data = msoa_feed.current
+    rows = data.df_index.date_slice(selected_date)
 
+    # selected areas / authorities as a mask over the date's rows
     if selected_area is None or selected_area == []:
         if selected_ltla is None or selected_ltla == []:
-            pass
+            keep = None
         else:
-            df1 = df1[df1['LtlaName'].isin(selected_ltla)]
+            keep = data.df['LtlaName'].values[rows].isin(selected_ltla)
     else:
-        df1 = df1[df1['areaName'].isin(selected_area)]
+        keep = data.df['areaName'].values[rows].isin(selected_area)
 
-    df1.loc[(df1.newCasesBySpecimenDateDirection == 'UP'), 'newCasesBySpecimenDateDirection'] = '↑'
-    df1.loc[(df1.newCasesBySpecimenDateDirection == 'DOWN'), 'newCasesBySpecimenDateDirection'] = '↓'
-    df1.loc[(df1.newCasesBySpecimenDateDirection == 'SAME'), 'newCasesBySpecimenDateDirection'] = '-'  # '↔'
+    pos = data.table_index.query(selected_date, sort_by, keep, filter_query)
+    covid_metrics.lap('filter')
 
-    df1 = df1.sort_values(by=['newCasesBySpecimenDateRollingSum'], ascending=False)
-    df1['Row'] = df1.reset_index().index
-    df1['Row'] += 1
+    if len(pos) == 0:
+        return [{
+            'areaName': 'Not Available',
+            'LtlaName': 'Not Available',
+            'newCasesBySpecimenDateRollingSum': 'Not Available'
+        }], 1
 
-    if df1.empty:
-        df1['LtlaName'] = ['Not Available']
-        df1['areaName'] = ['Not Available']
-        df1['newCasesBySpecimenDateRollingSum'] = ['Not Available']
+    page = data.table_index.page(pos, page_current, page_size or datatable_rows)
+    covid_metrics.lap('build')
 
-    return df1.to_dict('records')
+    return page
 
 
 '''
@@ -326,14 +401,15 @@ CALLBACK FOR CHART
         Input('msoa_drop', 'value')
     ]
 )
+@covid_metrics.instrument('chart')
 def return_chart(selected_ltla, selected_area):
+    data = msoa_feed.current
+
     if selected_area is None or selected_area == []:
         loc_area_list = ['Bents Green & Millhouses']
-        df1 = df[df['areaName'].isin(loc_area_list)]
         chart_title = 'Cases for Bents Green & Millhouses'
     else:
-        df1 = df[df['areaName'].isin(selected_area)]
-        loc_area_list = df1['areaName'].unique()
+        loc_area_list = selected_area
         if len(selected_area) == 1:
             chart_title = 'Cases for ' + str(selected_area[0])
         else:
@@ -378,20 +454,11 @@ def return_chart(selected_ltla, selected_area):
         )
     )
 
-    for la in loc_area_list:
-        dfx = df1.copy()[df1['areaName'] == la]
-        dfx['newCasesBySpecimenDateRollingSum'].fillna(0, inplace=True)  # solve problem of gap in chart if blank value
-        fig1.add_trace(
-            go.Scatter(
-                x=dfx['date'],
-                y=dfx['newCasesBySpecimenDateRollingSum'],
-                mode='lines',
-                name=la,
-                # text=dfx['areaName'],
-                customdata=dfx['newCasesBySpecimenDateRollingSum'],
-                hovertemplate='<br><b>%{customdata}</b>'  # '<br><b>%{text}</b>: %{customdata}'
-            )
-        )
+    # all selected areas are sliced from one date x area matrix, blanks already filled with 0
+    # (solves problem of gap in chart if blank value)
+    fig1 = fig1.to_dict()
+    fig1['data'] = data.cases_series.traces(loc_area_list, hovertemplate='<br><b>%{y}</b>')
+    covid_metrics.lap('build')
 
     return fig1
 
@@ -0,0 +1,108 @@
+import sys
+import time
+import argparse
+import http.client
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import covid_store
+import covid_ingest
+import covid_geocode
+
+'''
+=================================
+BACKFILL A RANGE OF RELEASE DATES
+=================================
+
+python backfill.py 2021-01-01 2021-01-31 [--workers 4] [--retries 3]
+
+Releases are downloaded concurrently on a bounded thread pool (fetch + streaming
+parse); as each one arrives it is geocoded and written to the data store on the
+main thread while the remaining downloads carry on. Dates already in the store
+are skipped. A release that is empty, missing or fails to download or parse is
+reported against its date and the rest carry on. --ltla-url/--uk-url point the
+fetch at another server, e.g. a local HTTP stub (see tests/test_backfill.py).
+'''
+
+
+def date_range(start, end):
+    return [d.strftime('%Y-%m-%d') for d in pd.date_range(start, end)]
+
+
+def fetch(dataset, url, d, retries, backoff):
+    t0 = time.time()
+    try:
+        df_load = covid_ingest.fetch_release(url, d, retries=retries, backoff=backoff)
+        return dataset, d, df_load, None, time.time() - t0
+    except (urllib.request.URLError, OSError, http.client.HTTPException,
+            pd.errors.EmptyDataError, pd.errors.ParserError) as err:  # HTTPError is a URLError
+        # reported against the date so one bad release does not stop the rest
+        return dataset, d, None, err, time.time() - t0
+
+
+def store(dataset, d, df_load, coord_lookup):
+    if dataset == 'daily':
+        df_load = covid_ingest.fill_counts(df_load)
+        df_load, not_found = covid_geocode.geocode(df_load, coord_lookup)
+
+    return covid_store.write_partition(dataset, d, df_load)
+
+
+def backfill(start, end, workers=4, retries=3, backoff=2.0, url_ltla=None, url_uk=None, force=False):
+    urls = {
+        'daily': url_ltla or covid_ingest.url_ltla,
+        'totals': url_uk or covid_ingest.url_uk
+    }
+
+    dates = date_range(start, end)
+    jobs = []
+
+    for dataset in ('daily', 'totals'):
+        loaded = set() if force else set(covid_store.list_dates(dataset))
+        jobs += [(dataset, d) for d in dates if d not in loaded]
+
+    print('Backfill', start, 'to', end, ':', len(jobs), 'releases to fetch,', len(dates) * 2 - len(jobs), 'already loaded')
+
+    if not jobs:
+        return {}
+
+    coord_lookup = covid_geocode.build_lookup()
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch, dataset, urls[dataset], d, retries, backoff) for dataset, d in jobs]
+
+        for f in as_completed(futures):
+            dataset, d, df_load, err, secs = f.result()
+
+            if err is not None:
+                not_available = getattr(err, 'code', None) == 404 or isinstance(err, pd.errors.EmptyDataError)
+                status = 'Not Available' if not_available else 'Failed: ' + repr(err)
+            elif df_load.empty:
+                status = 'Not Available'
+            else:
+                try:
+                    status = str(store(dataset, d, df_load, coord_lookup)) + ' rows'
+                except (KeyError, ValueError, OSError) as err:  # unexpected columns, bad values, disk
+                    status = 'Failed: ' + repr(err)
+
+            results[(dataset, d)] = status
+            print(d, dataset.ljust(6), '{:6.1f}s'.format(secs), status)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load a range of GovUK release dates into the covid data store')
+    parser.add_argument('start', help='first release date, YYYY-MM-DD')
+    parser.add_argument('end', help='last release date, YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent downloads')
+    parser.add_argument('--retries', type=int, default=3, help='retries per release on server/network errors')
+    parser.add_argument('--backoff', type=float, default=2.0, help='initial retry delay in seconds (doubles each retry)')
+    parser.add_argument('--ltla-url', help='override the local authority release url')
+    parser.add_argument('--uk-url', help='override the UK overview release url')
+    parser.add_argument('--force', action='store_true', help='reload dates that are already in the store')
+    args = parser.parse_args()
+
+    res = backfill(args.start, args.end, args.workers, args.retries, args.backoff, args.ltla_url, args.uk_url, args.force)
+    sys.exit(1 if any(v.startswith('Failed') for v in res.values()) else 0)
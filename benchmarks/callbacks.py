@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import resource
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+
+'''
+=========================================
+DASH CALLBACK BENCHMARKS (SYNTHETIC DATA)
+=========================================
+
+Builds a local data store and MSOA file from synthetic data for each history
+length, imports app.py and app_local.py against them in a fresh process, and
+calls every callback function directly over a matrix of inputs. Reports per
+callback:
+    p50_ms / p95_ms         latency over all inputs x repeats
+    payload_p50 / max       JSON response size in bytes (as Dash serialises it)
+    peak_mb                 peak Python allocation while running the callback (tracemalloc)
+plus start-up time and peak RSS per history length. Callbacks are unwrapped
+(inspect.unwrap) before timing, so memoized ones show the uncached cost.
+
+No network access is needed: COVID_DATA_DIR, COVID_MSOA_SOURCE and a dummy
+config.ini point the apps at the generated files.
+
+python benchmarks/callbacks.py --out results.json
+python benchmarks/callbacks.py --histories 28d,1y --repeat 3 --msoa-areas 1000
+python benchmarks/callbacks.py --compare before.json after.json
+'''
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+
+histories = {'28d': 28, '1y': 365, '3y': 1095}
+
+
+'''
+==========
+DATA SETUP
+==========
+'''
+
+
+def write_inputs(work_dir, days, ltla_areas, msoa_areas):
+    # data store + msoa csv + config.ini under work_dir (runs in the worker, after COVID_DATA_DIR is set)
+    import covid_store
+    from synthetic import ltla_frame, totals_frame, msoa_frame
+
+    for dataset, df in (('daily', ltla_frame(days, ltla_areas)), ('totals', totals_frame(days))):
+        for d, dfx in df.groupby('date'):
+            covid_store.write_partition(dataset, d, dfx)
+
+    msoa_frame(days, msoa_areas).to_csv(os.path.join(work_dir, 'msoa.csv'), index=False)
+
+    with open(os.path.join(work_dir, 'config.ini'), 'w') as f:
+        f.write('[mapbox]\nsecret_token = benchmark\n')
+
+
+'''
+===========
+MEASUREMENT
+===========
+'''
+
+
+def payload_size(value):
+    import plotly.utils
+
+    if hasattr(value, 'to_plotly_json'):
+        value = value.to_plotly_json()
+
+    return len(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def measure(func, cases, repeat):
+    # latency over all cases x repeat, then one traced pass for peak allocation
+    for args in cases:
+        func(*args)  # warm up (lazy imports, per-date sort orders ...)
+
+    latencies = []
+    for _ in range(repeat):
+        for args in cases:
+            t0 = time.perf_counter()
+            func(*args)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    sizes = [payload_size(func(*args)) for args in cases]
+
+    tracemalloc.start()
+    for args in cases:
+        func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'calls': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'payload_p50': int(np.percentile(sizes, 50)),
+        'payload_max': int(max(sizes)),
+        'peak_mb': round(peak / 1e6, 2)
+    }
+
+
+def app_cases(app):
+    data = app.covid_data.current
+    dates = data.df_index.dates()
+    areas = data.df_index.areas()
+
+    selections = [None, ['Sheffield'], areas[:10], areas[:50]]
+    switches = [(True, True), (True, False), (False, True), (False, False)]
+    spans = [o['value'] for o in app.span_options]
+    picks = [dates[-1], dates[0]]
+
+    by_date = [(d, a, dt, c) for d in picks for a in selections for dt, c in switches]
+
+    return {
+        'app.return_datatable': (inspect.unwrap(app.return_datatable), by_date),
+        'app.return_bar_charts': (inspect.unwrap(app.return_bar_charts), by_date),
+        'app.return_loc_auth_chart': (
+            inspect.unwrap(app.return_loc_auth_chart), [(a, s) for a in selections for s in spans]
+        ),
+        'app.return_tot_chart': (inspect.unwrap(app.return_tot_chart), [(s,) for s in spans]),
+        'app.return_summary': (inspect.unwrap(app.return_summary), [(d,) for d in picks])
+    }
+
+
+def app_local_cases(app_local):
+    data = app_local.msoa_feed.current
+    d = data.date_max
+    areas = data.df_index.areas()
+    ltlas = [o['value'] for o in data.ltla_options]
+    rows = app_local.datatable_rows
+
+    table = [
+        (d, None, None, 0, rows, [], ''),
+        (d, None, None, 5, rows, [], ''),
+        (d, ltlas[:1], None, 0, rows, [], ''),
+        (d, None, areas[:10], 0, rows, [], ''),
+        (d, None, None, 0, rows, [{'column_id': 'areaName', 'direction': 'asc'}], ''),
+        (d, None, None, 0, rows, [], '{newCasesBySpecimenDateRollingSum} > 150'),
+        (d, None, None, 0, rows, [], '{LtlaName} contains "1"')
+    ]
+
+    return {
+        'app_local.return_datatable': (inspect.unwrap(app_local.return_datatable), table),
+        'app_local.return_chart': (
+            inspect.unwrap(app_local.return_chart), [(None, a) for a in (None, areas[:1], areas[:10], areas[:50])]
+        )
+    }
+
+
+def run_worker(work_dir, days, ltla_areas, msoa_areas, repeat):
+    # one history length, in its own process so start-up and RSS are not shared between runs
+    sys.path[:0] = [repo_dir, bench_dir]
+    os.chdir(work_dir)
+
+    t0 = time.perf_counter()
+    write_inputs(work_dir, days, ltla_areas, msoa_areas)
+    setup_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    import app
+    app_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    import app_local
+    app_local_s = time.perf_counter() - t0
+
+    callbacks = {}
+    for cases in (app_cases(app), app_local_cases(app_local)):
+        for name, (func, args) in cases.items():
+            callbacks[name] = measure(func, args, repeat)
+
+    return {
+        'days': days,
+        'ltla_rows': int(len(app.covid_data.current.frames['daily'])),
+        'msoa_rows': int(len(app_local.msoa_feed.current.df)),
+        'setup_s': round(setup_s, 2),
+        'startup_s': {'app': round(app_s, 2), 'app_local': round(app_local_s, 2)},
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'callbacks': callbacks
+    }
+
+
+'''
+======================
+RUN / REPORT / COMPARE
+======================
+'''
+
+
+def run(names, ltla_areas, msoa_areas, repeat, keep=False):
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeat': repeat,
+            'ltla_areas': ltla_areas,
+            'msoa_areas': msoa_areas
+        },
+        'runs': {}
+    }
+
+    for name in names:
+        work_dir = tempfile.mkdtemp(prefix='covid_bench_' + name + '_')
+        env = dict(
+            os.environ,
+            COVID_DATA_DIR=os.path.join(work_dir, 'data'),
+            COVID_MSOA_SOURCE=os.path.join(work_dir, 'msoa.csv'),
+            COVID_POPULATION_FILE=os.path.join(work_dir, 'population.csv'),
+            COVID_STARTUP='preload',
+            COVID_REMOTE_FALLBACK='',
+            PYTHONWARNINGS='ignore'
+        )
+        cmd = [
+            sys.executable, os.path.abspath(__file__), '--worker', work_dir,
+            '--days', str(histories[name]), '--ltla-areas', str(ltla_areas),
+            '--msoa-areas', str(msoa_areas), '--repeat', str(repeat)
+        ]
+
+        print('running', name, '...', file=sys.stderr)
+        out = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True).stdout
+        results['runs'][name] = json.loads(out.decode().strip().splitlines()[-1])
+
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def report(results):
+    for name, r in results['runs'].items():
+        print('\n{} - {} LTLA rows, {} MSOA rows, start-up app {}s / app_local {}s, max RSS {}MB'.format(
+            name, r['ltla_rows'], r['msoa_rows'], r['startup_s']['app'], r['startup_s']['app_local'],
+            r['max_rss_mb']))
+        print('  {:<30} {:>9} {:>9} {:>11} {:>11} {:>8}'.format(
+            'callback', 'p50 ms', 'p95 ms', 'payload p50', 'payload max', 'peak MB'))
+
+        for cb, m in r['callbacks'].items():
+            print('  {:<30} {:>9.2f} {:>9.2f} {:>11,} {:>11,} {:>8.2f}'.format(
+                cb, m['p50_ms'], m['p95_ms'], m['payload_p50'], m['payload_max'], m['peak_mb']))
+
+
+def compare(before_file, after_file):
+    # p50 latency and payload ratios (after / before) for every callback in both files
+    with open(before_file) as f:
+        before = json.load(f)
+    with open(after_file) as f:
+        after = json.load(f)
+
+    print('  {:<6} {:<30} {:>10} {:>10} {:>8} {:>12}'.format('run', 'callback', 'p50 before', 'p50 after', 'ratio', 'payload'))
+
+    for name, r in after['runs'].items():
+        for cb, m in r['callbacks'].items():
+            b = before['runs'].get(name, {}).get('callbacks', {}).get(cb)
+            if b is None:
+                continue
+            print('  {:<6} {:<30} {:>10.2f} {:>10.2f} {:>7.2f}x {:>11.2f}x'.format(
+                name, cb, b['p50_ms'], m['p50_ms'], m['p50_ms'] / max(b['p50_ms'], 1e-9),
+                m['payload_p50'] / max(b['payload_p50'], 1)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard callbacks on synthetic data.')
+    parser.add_argument('--histories', default=','.join(histories), help='comma separated: ' + ', '.join(histories))
+    parser.add_argument('--ltla-areas', type=int, default=380)
+    parser.add_argument('--msoa-areas', type=int, default=6800)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='write the results as JSON to this file (default: stdout)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated data directories')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--days', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+
+    elif args.worker:
+        print(json.dumps(run_worker(args.worker, args.days, args.ltla_areas, args.msoa_areas, args.repeat)))
+
+    else:
+        res = run(args.histories.split(','), args.ltla_areas, args.msoa_areas, args.repeat, args.keep)
+
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(res, f, indent=2)
+            report(res)
+        else:
+            print(json.dumps(res, indent=2))
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import plotly.graph_objects as go
+import plotly.utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import covid_schema
+from covid_index import CovidIndex
+from covid_map import MapLayer
+from covid_rank import RankIndex
+from synthetic import ltla_frame
+
+'''
+=====================
+MAP PAYLOAD BENCHMARK
+=====================
+
+JSON size and build time of the map trace for one date, built the old way
+(go.Scattermapbox with an object customdata stack) and from MapLayer, on a
+synthetic LTLA frame. No network or data files needed.
+
+python benchmarks/map_payload.py [areas] [days]
+'''
+
+metrics = [
+    'newCasesByPublishDate',
+    'newDeaths28DaysByPublishDate',
+    'cumCasesByPublishDate',
+    'cumDeaths28DaysByPublishDate'
+]
+
+
+def legacy_trace(df1, display, selected_date):
+    # the map trace as return_datatable built it before MapLayer
+    df1 = df1.sort_values(by=[display], ascending=False)
+
+    return go.Scattermapbox(
+        lat=df1['Latitude'],
+        lon=df1['Longitude'],
+        mode='text+markers',
+        marker={'size': df1[display] * 50 / df1[display].max(), 'color': 'teal'},
+        name='',
+        text=df1['areaName'],
+        textposition='top center',
+        customdata=np.stack(
+            (
+                np.full(df1.shape[0], selected_date, dtype=object),
+                df1['newCasesByPublishDate'],
+                df1['newDeaths28DaysByPublishDate'],
+                df1['cumCasesByPublishDate'],
+                df1['cumDeaths28DaysByPublishDate']
+            ),
+            axis=-1
+        ),
+        hovertemplate='<br><b>Date</b>: %{customdata[0]}'
+    ).to_plotly_json()
+
+
+def measure(build, repeat=20):
+    build()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        trace = build()
+    ms = (time.perf_counter() - t0) / repeat * 1000
+
+    return {'ms': round(ms, 2), 'bytes': len(json.dumps(trace, cls=plotly.utils.PlotlyJSONEncoder))}
+
+
+if __name__ == '__main__':
+    n_areas = int(sys.argv[1]) if len(sys.argv) > 1 else 380
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 28
+
+    df_index = CovidIndex(covid_schema.apply_schema(ltla_frame(n_days, n_areas)))
+    layer = MapLayer(df_index, metrics)
+    ranks = RankIndex(df_index, metrics)
+    d = df_index.dates()[-1]
+    display = 'newCasesByPublishDate'
+
+    results = {
+        'areas': n_areas,
+        'before': measure(lambda: legacy_trace(df_index.select(d), display, d)),
+        'after': measure(lambda: layer.trace(ranks.top(d, display), display, 'teal', 50, '<br><b>Date</b>: ' + d))
+    }
+
+    print(json.dumps(results, indent=2))
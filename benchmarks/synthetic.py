@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+'''
+==============================
+SYNTHETIC COVID DATA (OFFLINE)
+==============================
+
+Frames shaped like the GovUK releases the apps load - LTLA daily rows, UK
+totals and the weekly MSOA feed - with random but plausible values, for
+benchmarking without the network. Area names include the apps' defaults
+(Sheffield, Bents Green & Millhouses) so default views have data.
+'''
+
+end_date = '2022-06-30'
+
+
+def daily_dates(days, end=end_date):
+    return pd.date_range(end=end, periods=days, freq='D').strftime('%Y-%m-%d')
+
+
+def ltla_frame(days, areas=380, end=end_date, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = daily_dates(days, end)
+    names = ['Sheffield', 'Leeds', 'Manchester'] + ['Authority ' + str(i) for i in range(3, areas)]
+
+    new_cases = rng.integers(0, 2000, (days, areas))
+    new_deaths = rng.integers(0, 50, (days, areas))
+
+    return pd.DataFrame({
+        'date': np.repeat(dates, areas),
+        'areaType': 'ltla',
+        'areaCode': np.tile(['E0' + str(8000000 + i) for i in range(areas)], days),
+        'areaName': np.tile(names, days),
+        'cumCasesByPublishDate': new_cases.cumsum(axis=0).ravel(),
+        'newCasesByPublishDate': new_cases.ravel(),
+        'newDeaths28DaysByPublishDate': new_deaths.ravel(),
+        'cumDeaths28DaysByPublishDate': new_deaths.cumsum(axis=0).ravel(),
+        'Latitude': np.tile(rng.uniform(50, 58, areas), days),
+        'Longitude': np.tile(rng.uniform(-5, 1.5, areas), days)
+    })
+
+
+def totals_frame(days, end=end_date, seed=1):
+    rng = np.random.default_rng(seed)
+    new_cases = rng.integers(10000, 200000, days)
+    new_deaths = rng.integers(10, 1000, days)
+
+    return pd.DataFrame({
+        'date': daily_dates(days, end),
+        'areaType': 'overview',
+        'areaCode': 'K02000001',
+        'areaName': 'United Kingdom',
+        'cumCasesByPublishDate': new_cases.cumsum(),
+        'newCasesByPublishDate': new_cases,
+        'newDeaths28DaysByPublishDate': new_deaths,
+        'cumDeaths28DaysByPublishDate': new_deaths.cumsum()
+    })
+
+
+def msoa_frame(days, areas=6800, ltlas=315, end=end_date, seed=2):
+    # the MSOA feed is published weekly, so one date per 7 days of history
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=end, periods=max(1, days // 7), freq='7D').strftime('%Y-%m-%d')
+    weeks = len(dates)
+
+    names = ['Bents Green & Millhouses'] + ['Local Area ' + str(i) for i in range(1, areas)]
+    ltla = ['Sheffield'] + ['Authority ' + str(i) for i in range(1, ltlas)]
+    area_ltla = np.arange(areas) % ltlas
+
+    rolling_sum = rng.integers(0, 300, (weeks, areas)).astype(float)
+    rolling_sum[rng.random((weeks, areas)) < 0.05] = np.nan  # suppressed small counts
+    change = rng.integers(-50, 50, (weeks, areas))
+
+    return pd.DataFrame({
+        'regionCode': 'E12000003',
+        'regionName': 'Yorkshire and The Humber',
+        'UtlaCode': np.tile(['E0' + str(8000000 + i) for i in area_ltla], weeks),
+        'UtlaName': np.tile([ltla[i] for i in area_ltla], weeks),
+        'LtlaCode': np.tile(['E0' + str(8000000 + i) for i in area_ltla], weeks),
+        'LtlaName': np.tile([ltla[i] for i in area_ltla], weeks),
+        'areaType': 'msoa',
+        'areaCode': np.tile(['E0' + str(2000000 + i) for i in range(areas)], weeks),
+        'areaName': np.tile(names, weeks),
+        'date': np.repeat(dates, areas),
+        'newCasesBySpecimenDateRollingSum': rolling_sum.ravel(),
+        'newCasesBySpecimenDateRollingRate': np.round(rolling_sum.ravel() / 8, 1),
+        'newCasesBySpecimenDateChange': change.ravel(),
+        'newCasesBySpecimenDateChangePercentage': np.round(rng.uniform(-60, 60, weeks * areas), 1),
+        'newCasesBySpecimenDateDirection': np.where(change > 0, 'UP', np.where(change < 0, 'DOWN', 'SAME')).ravel()
+    })
@@ -0,0 +1,186 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from covid_schema import float_values
+
+'''
+==========================================
+ROLLING / GROWTH ANALYTICS (PER DATA LOAD)
+==========================================
+
+Computed for every local authority in one pass over a day x authority matrix
+of new cases, then written back as columns row-aligned with the daily frame:
+    casesRolling7           cases in the 7 days to the date
+    casesRate7Per100k       casesRolling7 per 100,000 people
+    casesWeekOnWeekPct      change in casesRolling7 on the week before, %
+    casesDoublingDays       days for casesRolling7 to double at the current weekly growth (growing areas only)
+
+Counts are by publish date, and GovUK stopped publishing at weekends in 2022:
+a day with no row between an authority's first and last rows counts as 0 new
+cases (the next release carries them), so a 7-day window spanning a weekend is
+still complete. The figures for a date look back two weeks, so a caller only
+needs to pass lookback days of history ahead of the dates it shows.
+
+Populations come from population.csv (areaCode, areaName, population - the ONS
+mid-year estimates, written by python covid_analytics.py population), or the
+file named by COVID_POPULATION_FILE. Authorities without a population get NaN
+rates; nothing is estimated.
+'''
+
+population_file = os.environ.get('COVID_POPULATION_FILE', 'population.csv')
+
+# ONS mid-year population estimates, all ages, per local authority district / unitary (nomis)
+population_url = os.environ.get(
+    'COVID_POPULATION_URL',
+    'https://www.nomisweb.co.uk/api/v01/dataset/NM_2002_1.data.csv?geography=TYPE424&date=latest'
+    '&gender=0&c_age=200&measures=20100&select=geography_code,geography_name,obs_value'
+)
+
+# areas GovUK reports combined: ONS code -> code of the combined area
+combined_areas = {
+    'E06000053': 'E06000052',  # Isles of Scilly -> Cornwall and Isles of Scilly
+    'E09000001': 'E09000012'  # City of London -> Hackney and City of London
+}
+combined_names = {
+    'E06000052': 'Cornwall and Isles of Scilly',
+    'E09000012': 'Hackney and City of London'
+}
+window = 7  # days
+lookback = 6 * window  # days of history ahead of the first date the figures are wanted for
+
+analytics_columns = [
+    'casesRolling7',
+    'casesRate7Per100k',
+    'casesWeekOnWeekPct',
+    'casesDoublingDays'
+]
+
+# display format per column, e.g. for the map hover (a missing figure shows as '-')
+analytics_formats = {
+    'casesRolling7': '{:,.0f}',
+    'casesRate7Per100k': '{:,.1f}',
+    'casesWeekOnWeekPct': '{:+.1f}%',
+    'casesDoublingDays': '{:.1f} days'
+}
+
+
+def load_population(file=None):
+    # areaCode -> population, empty when there is no population file
+    file = file or population_file
+
+    if not os.path.exists(file):
+        return {}
+
+    df = pd.read_csv(file)
+
+    return dict(zip(df['areaCode'], pd.to_numeric(df['population'], errors='coerce')))
+
+
+def fetch_population(file=None, url=None):
+    # download the ONS estimates and write them as population.csv, on GovUK's area codes
+    df = pd.read_csv(url or population_url)
+    df.columns = [c.lower() for c in df.columns]
+
+    df = pd.DataFrame({
+        'areaCode': df['geography_code'].replace(combined_areas),
+        'areaName': df['geography_name'],
+        'population': pd.to_numeric(df['obs_value'], errors='coerce')
+    })
+    df = df.groupby('areaCode', as_index=False).agg({'areaName': 'first', 'population': 'sum'})
+    df['areaName'] = df['areaCode'].map(combined_names).fillna(df['areaName'])
+
+    df.to_csv(file or population_file, index=False)
+
+    return df
+
+
+def day_matrix(df, value_col, area_col='areaName'):
+    # (days, areas) matrix of value_col over a gap-free daily axis, NaN where there is no row
+    dates = pd.to_datetime(df['date']).values
+    day = ((dates - dates.min()) // np.timedelta64(1, 'D')).astype(np.int64)
+    code, areas = pd.factorize(df[area_col], sort=True)
+
+    m = np.full((day.max() + 1 if len(day) else 0, len(areas)), np.nan)
+    m[day, code] = float_values(df[value_col])
+
+    return m, day, code, list(areas)
+
+
+def fill_gaps(m, before=None):
+    # NaN between each column's first and last value -> 0 (no publication that day), NaN outside;
+    # before marks the columns that have a value ahead of the first row of m
+    present = ~np.isnan(m)
+    started = np.logical_or.accumulate(present, axis=0)
+
+    if before is not None:
+        started |= before
+    more = np.logical_or.accumulate(present[::-1], axis=0)[::-1]
+
+    return np.where(started & more & ~present, 0, m)
+
+
+def window_sum(m, w):
+    # sum over the w days to each day; NaN unless all w days are present
+    present = ~np.isnan(m)
+    zero = np.zeros((1, m.shape[1]))
+
+    total = np.vstack([zero, np.cumsum(np.where(present, m, 0), axis=0)])
+    count = np.vstack([zero, np.cumsum(present, axis=0)])
+
+    out = np.full(m.shape, np.nan)
+    out[w - 1:] = total[w:] - total[:-w]
+    out[w - 1:][(count[w:] - count[:-w]) < w] = np.nan
+
+    return out
+
+
+def shift(m, n):
+    # rows moved down n days, NaN at the top
+    out = np.full(m.shape, np.nan)
+    out[n:] = m[:-n]
+
+    return out
+
+
+def compute(df, population=None, value_col='newCasesByPublishDate'):
+    # analytics_columns for every row of df, as a row-aligned frame
+    m, day, code, areas = day_matrix(df, value_col, 'areaCode')
+    population = population or {}
+
+    rolling = window_sum(fill_gaps(m), window)
+    previous = shift(rolling, window)
+    pop = np.array([population.get(a, np.nan) for a in areas], dtype='float64')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = rolling / pop * 100000
+        wow = np.where(previous > 0, (rolling - previous) / previous * 100, np.nan)
+
+        growth = rolling / previous
+        doubling = np.where(growth > 1, window * np.log(2) / np.log(growth), np.nan)
+
+    return pd.DataFrame(
+        {
+            c: v[day, code].astype('float32')
+            for c, v in zip(analytics_columns, (rolling, rate, wow, doubling))
+        },
+        index=df.index
+    )
+
+
+def add_analytics(df, population=None, value_col='newCasesByPublishDate'):
+    # df with analytics_columns added (a shallow copy - the raw columns are shared, not copied)
+    df = df.copy(deep=False)
+
+    for c, s in compute(df, population, value_col).items():
+        df[c] = s
+
+    return df
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['population']:
+        pop = fetch_population()
+        print(len(pop), 'areas, total population', '{:,.0f}'.format(pop['population'].sum()), '->', population_file)
+    else:
+        print('python covid_analytics.py population    # write', population_file, 'from', population_url)
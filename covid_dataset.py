@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+import covid_store
+import covid_snapshot
+
+'''
+=========================
+LIVE DATASET (HOT RELOAD)
+=========================
+
+Holds the current immutable data version for a dashboard. build(frames, version)
+turns the raw frames into everything the callbacks need (index, pre-computed
+figures, dropdown options ...) and must return an object with .version and
+.frames. New data is merged in off to the side and published with a single
+reference swap, so a callback that reads .current once never sees a half-loaded
+dataset.
+
+On reload every worker maps the snapshot again rather than merging the new
+partitions into a private copy of the history: the first worker to get there
+rewrites the shared file with the new days, once for all of them (see
+covid_snapshot). When the days were only appended, extend(current, frames,
+version, start) - start being the first new row of each frame - can build from
+the current data instead of starting over.
+'''
+
+
+class LiveDataset:
+
+    def __init__(self, build, prepare=None, check_every=30, extend=None):
+        self.build = build
+        self.prepare = prepare or (lambda df, dataset: df)  # e.g. dtype conversion, applied to every frame read
+        self.extend = extend  # extend(current, frames, version, start): build from current when days were only appended
+        self.check_every = check_every  # seconds between manifest checks
+        self.current = None
+        self.listeners = []
+        self._partitions = {}
+        self._checked = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def manifest_mtime(self):
+        try:
+            return os.path.getmtime(covid_store.manifest_file)
+        except OSError:
+            return None
+
+    def read(self, verify=True):
+        # frames mapped from the snapshot, its version, and the partitions in it
+        frames = {ds: self.prepare(covid_snapshot.load_snapshot(ds, verify=verify), ds) for ds in covid_store.datasets}
+        manifest = covid_snapshot.read_manifest()
+        partitions = {ds: (manifest['datasets'].get(ds) or {}).get('partitions') or {} for ds in frames}
+
+        return frames, manifest['version'] or covid_store.data_version(), partitions
+
+    def load(self):
+        self._mtime = self.manifest_mtime()
+        frames, version, self._partitions = self.read()
+
+        self.publish(self.build(frames, version))
+
+        return self.current
+
+    def ensure(self):
+        # for deferred start-up: the first caller loads, concurrent callers wait for it
+        if self.current is None:
+            with self._lock:
+                if self.current is None:
+                    self.load()
+
+        return self.current
+
+    def publish(self, data):
+        self.current = data
+
+        for f in self.listeners:
+            f(data)
+
+    def appended_from(self, ds, df, partitions):
+        # first row of the days added to the current frame, or None if df is not the current frame plus later days
+        old = self._partitions.get(ds) or {}
+        current = self.current.frames[ds]
+
+        if not old or any(partitions.get(d) != p for d, p in old.items()) or df.shape[0] < current.shape[0]:
+            return None
+
+        if any(d <= max(old) for d in partitions if d not in old):
+            return None
+
+        return current.shape[0]
+
+    def refresh(self, force=False):
+        # cheap enough to call before every request: at most one stat() per check_every seconds
+        now = time.time()
+
+        if not force and now - self._checked < self.check_every:
+            return False
+
+        self._checked = now
+        mtime = self.manifest_mtime()
+
+        if mtime == self._mtime or not self._lock.acquire(blocking=False):
+            return False
+
+        try:
+            self._mtime = mtime
+
+            if covid_store.data_version() == self.current.version:
+                return False
+
+            # the first worker here appends the new days to the shared snapshot, the rest map the file it wrote
+            frames, version, partitions = self.read(verify=False)
+            start = {ds: self.appended_from(ds, df, partitions[ds]) for ds, df in frames.items()}
+
+            if self.extend is not None and None not in start.values():
+                data = self.extend(self.current, frames, version, start)
+            else:
+                data = self.build(frames, version)
+
+            for ds in frames:
+                new_dates = sorted(set(partitions[ds]) - set(self._partitions.get(ds) or {}))
+                if new_dates:
+                    print('Reloaded', ds, ':', ', '.join(new_dates))
+
+            self._partitions = partitions
+            self.publish(data)
+
+            return True
+
+        finally:
+            self._lock.release()
@@ -0,0 +1,191 @@
+import os
+import time
+import urllib.request
+import pandas as pd
+import covid_store
+
+'''
+===========================================
+GEOCODE LOCAL AUTHORITIES (VECTORIZED JOIN)
+===========================================
+
+Latitude/longitude are added to a whole release in one merge against an
+areaName -> (lat, long) lookup. Authorities that are still missing are reported
+together and looked up in the cached doogal gazetteer.
+'''
+
+lat_long_file = 'lat_long.xlsx'
+doogal_url = 'https://www.doogal.co.uk/AdministrativeAreas.php'
+gazetteer_file = os.path.join(covid_store.data_dir, 'gazetteer.csv')
+gazetteer_ttl = 30 * 24 * 60 * 60  # seconds
+gazetteer_retry = 60 * 60  # seconds before trying again after a failed refresh
+
+_gazetteer = None
+_gazetteer_expires = 0
+
+# following are missing coordinates from doogal website
+coords = [
+    ('Aylesbury Vale', 51.8996278, -1.1193516),
+    ('Chiltern', 51.6788424, -0.7737162),
+    ('South Bucks', 51.5600494, -0.7301907),
+    ('Wycombe', 51.6635175, -0.9501978)
+]
+
+# GovUK area name -> doogal area name
+aliases = {
+    'Hackney and City of London': 'Hackney',
+    'Cornwall and Isles of Scilly': 'Cornwall',
+    'Comhairle nan Eilean Siar': 'Na h-Eileanan Siar'
+}
+
+
+def build_lookup(df_lat_long=None):
+    # areaName -> (lat, long) from lat_long.xlsx, with the hard-coded coords on top
+    if df_lat_long is None:
+        df_lat_long = pd.read_excel(lat_long_file)
+
+    df1 = df_lat_long.dropna(subset=['areaName'])
+    lat = pd.to_numeric(df1['Latitude'], errors='coerce')
+    long = pd.to_numeric(df1['Longitude'], errors='coerce')
+
+    lookup = dict(zip(df1['areaName'], zip(lat, long)))
+    lookup.update({la: (lat, long) for la, lat, long in coords})
+
+    return lookup
+
+
+'''
+=========================
+DOOGAL GAZETTEER (CACHED)
+=========================
+
+The doogal administrative areas page is fetched and parsed at most once per
+TTL and kept as a local csv; lookups are then answered from memory until the
+csv is older than the TTL, so a long-running loader picks up a refresh too.
+A saved copy of the page (e.g. tests/fixtures/doogal.html) is parsed without
+touching the cached csv unless a target file is given, and geocode() can be
+handed such a table instead of going to doogal.
+'''
+
+
+def parse_doogal(source):
+    # source: url response, file object or path to a saved copy of the page
+    import bs4 as bs
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            soup = bs.BeautifulSoup(f, 'lxml')
+    else:
+        soup = bs.BeautifulSoup(source, 'lxml')
+
+    rows = []
+    for tr in soup.find_all('tr'):
+        row = [i.text.strip() for i in tr.find_all(['th', 'td'])]
+        if len(row) > 3:
+            rows.append((row[0], row[2], row[3]))
+
+    df = pd.DataFrame(rows, columns=['areaName', 'Latitude', 'Longitude'])
+    df['Latitude'] = pd.to_numeric(df['Latitude'], errors='coerce')
+    df['Longitude'] = pd.to_numeric(df['Longitude'], errors='coerce')
+
+    # header rows have no numeric lat/long
+    return df.dropna(subset=['Latitude', 'Longitude']).drop_duplicates(subset=['areaName'])
+
+
+def refresh_gazetteer(source=None, file=None):
+    # parse the live page into file (default gazetteer_file); a given source is only written to an explicit file
+    if source is None:
+        source = urllib.request.urlopen(doogal_url)
+        file = file or gazetteer_file
+
+    df = parse_doogal(source)
+
+    if file:
+        os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+        tmp = covid_store.tmp_name(file)
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, file)
+
+    return df
+
+
+def load_gazetteer(refresh=False, source=None, file=None):
+    # areaName -> (lat, long) from the cached doogal table, plus aliases and the hard-coded coords
+    fresh = os.path.exists(gazetteer_file) and time.time() - os.path.getmtime(gazetteer_file) < gazetteer_ttl
+
+    if refresh or source is not None or not fresh:
+        try:
+            df = refresh_gazetteer(source, file)
+        except OSError as err:  # includes urllib HTTPError/URLError
+            print('Unable to refresh gazetteer:', err)
+            if os.path.exists(gazetteer_file):
+                df = pd.read_csv(gazetteer_file)  # serve the stale copy
+            else:
+                df = pd.DataFrame(columns=['areaName', 'Latitude', 'Longitude'])
+    else:
+        df = pd.read_csv(gazetteer_file)
+
+    table = dict(zip(df['areaName'], zip(df['Latitude'], df['Longitude'])))
+
+    for la, doogal_name in aliases.items():
+        if doogal_name in table:
+            table[la] = table[doogal_name]
+
+    table.update({la: (lat, long) for la, lat, long in coords})
+
+    return table
+
+
+def gazetteer(refresh=False):
+    # in-memory table, reloaded once the cached csv passes its TTL (or an hour after a failed refresh)
+    global _gazetteer, _gazetteer_expires
+
+    if _gazetteer is None or refresh or time.time() >= _gazetteer_expires:
+        _gazetteer = load_gazetteer(refresh)
+
+        now = time.time()
+        written = os.path.getmtime(gazetteer_file) if os.path.exists(gazetteer_file) else now
+        _gazetteer_expires = max(written + gazetteer_ttl, now + gazetteer_retry)
+
+    return _gazetteer
+
+
+'''
+=======
+GEOCODE
+=======
+'''
+
+
+def geocode(df_load, lookup, table=None):
+    # returns df_load with Latitude/Longitude and the sorted list of authorities not found;
+    # table is the gazetteer to try for the rest (default gazetteer(), which may fetch the doogal page)
+    df_coords = pd.DataFrame(
+        list(lookup.values()),
+        index=list(lookup.keys()),
+        columns=['Latitude', 'Longitude']
+    )
+
+    df1 = df_load.drop(columns=['Latitude', 'Longitude'], errors='ignore')
+    df1 = df1.merge(df_coords, how='left', left_on='areaName', right_index=True)
+
+    missing = sorted(df1.loc[df1['Latitude'].isna(), 'areaName'].dropna().unique())
+
+    if missing:
+        print('Not in lookup, trying doogal gazetteer:', ', '.join(missing))
+        table = gazetteer() if table is None else table
+        found = {la: table[la] for la in missing if la in table}
+
+        if found:
+            lookup.update(found)
+            fill = df1['areaName'].map(found)
+            mask = fill.notna()
+            df1.loc[mask, 'Latitude'] = [c[0] for c in fill[mask]]
+            df1.loc[mask, 'Longitude'] = [c[1] for c in fill[mask]]
+
+        missing = [la for la in missing if la not in found]
+
+    if missing:
+        print('*** Not Found ***', ', '.join(missing))
+
+    return df1, missing
@@ -0,0 +1,82 @@
+import numpy as np
+from covid_schema import date_strings
+
+'''
+=================================
+DATE / AREA INDEX OVER COVID DATA
+=================================
+
+Built once at start-up. The frame is sorted by (date, area) so every date is a
+contiguous block of rows and callbacks slice it directly instead of scanning.
+'''
+
+
+class CovidIndex:
+
+    def __init__(self, df, area_col='areaName', presorted=False):
+        # presorted frames (e.g. a memory-mapped snapshot) are used as they are, without a copy;
+        # all lookups below are positional
+        if not presorted:
+            df = df.sort_values(by=['date', area_col], kind='mergesort').reset_index(drop=True)
+
+        self.df = df
+        self.area_col = area_col
+
+        # 'YYYY-MM-DD' -> (first row, last row + 1)
+        uniq, starts = np.unique(self.df['date'].values, return_index=True)
+        stops = np.append(starts[1:], len(self.df))
+        self.date_ranges = {d: (int(a), int(b)) for d, a, b in zip(date_strings(uniq), starts, stops)}
+
+        # area -> row positions (in date order)
+        self.area_positions = self.df.groupby(area_col, sort=True, observed=True).indices
+
+    def row_dates(self):
+        # row -> position of its date in dates()
+        date_pos = np.empty(len(self.df), dtype=np.int32)
+
+        for i, d in enumerate(self.dates()):
+            start, stop = self.date_ranges[d]
+            date_pos[start:stop] = i
+
+        return date_pos
+
+    def dates(self):
+        return sorted(self.date_ranges)
+
+    def areas(self):
+        return list(self.area_positions)
+
+    def has_area(self, area):
+        return area in self.area_positions
+
+    def date_slice(self, d):
+        start, stop = self.date_ranges.get(d, (0, 0))
+        return slice(start, stop)
+
+    def select(self, d, areas=None):
+        # rows for one date, optionally restricted to a list of areas
+        df1 = self.df.iloc[self.date_slice(d)]
+
+        if not areas:
+            return df1
+
+        return df1[df1[self.area_col].isin(areas)]
+
+    def positions(self, d, areas=None):
+        # row positions for one date, optionally restricted to a list of areas
+        rows = self.date_slice(d)
+        pos = np.arange(rows.start, rows.stop)
+
+        if not areas:
+            return pos
+
+        return pos[self.df[self.area_col].iloc[rows].isin(areas).values]
+
+    def for_areas(self, areas):
+        # full history for a list of areas, in date order
+        pos = [self.area_positions[a] for a in areas if a in self.area_positions]
+
+        if not pos:
+            return self.df.iloc[0:0]
+
+        return self.df.iloc[np.sort(np.concatenate(pos))]
@@ -0,0 +1,98 @@
+import time
+import socket
+import http.client
+import urllib.request
+import pandas as pd
+
+'''
+======================================
+STREAMING INGEST OF GOVUK CSV RELEASES
+======================================
+
+The API returns every date since 2020 in date order, so the release is read in
+chunks, only rows for the requested date(s) are kept, and reading stops as soon
+as the requested range has been passed.
+'''
+
+url_ltla = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=ltla&metric=cumCasesByPublishDate&metric=newCasesByPublishDate&metric=newDeaths28DaysByPublishDate&metric=cumDeaths28DaysByPublishDate&format=csv'
+url_uk = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=overview&metric=cumCasesByPublishDate&metric=newCasesByPublishDate&metric=newDeaths28DaysByPublishDate&metric=cumDeaths28DaysByPublishDate&format=csv'
+
+chunk_rows = 20000
+timeout = 60  # seconds without data before a read gives up (fetch_release retries it)
+
+count_columns = [
+    'newCasesByPublishDate',
+    'cumCasesByPublishDate',
+    'newDeaths28DaysByPublishDate',
+    'cumDeaths28DaysByPublishDate'
+]
+
+
+def read_release(url, dates, chunksize=chunk_rows):
+    dates = set(dates)
+    date_lo, date_hi = min(dates), max(dates)
+
+    parts = []
+    columns = None
+    seen = False
+
+    # pass the open response so pandas parses as it downloads (given a url it reads the whole body first)
+    source = urllib.request.urlopen(url, timeout=timeout) if '://' in url else open(url, 'rb')
+
+    try:
+        reader = pd.read_csv(source, chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        # an empty body (200 or 204) is what GovUK sends for a release with no data
+        source.close()
+        return pd.DataFrame()
+
+    try:
+        for chunk in reader:
+            columns = chunk.columns
+            mask = chunk['date'].isin(dates)
+
+            if mask.any():
+                parts.append(chunk[mask])
+                seen = True
+
+            # rows are grouped by date, so once past the range there is nothing more to find
+            last = chunk['date'].iloc[-1]
+            if seen and (last < date_lo or last > date_hi):
+                break
+    finally:
+        reader.close()
+        source.close()
+
+    if not parts:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def fetch_release(url, d, retries=3, backoff=2.0):
+    # rows for date d from the release published on d, retrying server errors with exponential backoff
+    url = url + '&release=' + d
+
+    for attempt in range(retries + 1):
+        try:
+            return read_release(url, [d])
+
+        except urllib.request.HTTPError as err:
+            # 404 = release not published, other 4xx won't get better by retrying
+            if attempt == retries or (err.code < 500 and err.code != 429):
+                raise
+
+        except (urllib.request.URLError, ConnectionError, socket.timeout, http.client.HTTPException):
+            # HTTPException: connection dropped part way through the body (IncompleteRead etc.)
+            if attempt == retries:
+                raise
+
+        time.sleep(backoff * 2 ** attempt)
+
+
+def fill_counts(df_load):
+    for c in count_columns:
+        if c in df_load.columns:
+            df_load[c] = df_load[c].fillna(0)
+
+    return df_load
@@ -0,0 +1,86 @@
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+=========================
+BACKGROUND LOAD JOB QUEUE
+=========================
+
+Data loads run on a small in-process worker pool instead of inside the Dash
+callback. Jobs are keyed (by release date), so repeated requests for a key that
+is still queued or running collapse onto the same job. Each job records the time
+spent in every stage.
+'''
+
+
+class Job:
+
+    def __init__(self, key):
+        self.key = key
+        self.status = 'queued'  # queued -> running -> done / failed
+        self.stage = ''
+        self.messages = {}
+        self.timings = []
+        self.error = None
+        self.created = time.time()
+
+    @contextmanager
+    def timed(self, stage):
+        self.stage = stage
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.timings.append((stage, time.time() - t0))
+
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def summary(self):
+        return ', '.join(stage + ' ' + '{:.1f}s'.format(secs) for stage, secs in self.timings)
+
+
+class JobQueue:
+
+    def __init__(self, run, workers=1):
+        self.run = run
+        self.jobs = {}
+        self.listeners = []  # called with each finished job
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, key):
+        with self._lock:
+            job = self.jobs.get(key)
+
+            if job is not None and not job.finished():
+                return job
+
+            job = Job(key)
+            self.jobs[key] = job
+
+        self._pool.submit(self._run, job)
+
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self.jobs.get(key)
+
+    def _run(self, job):
+        job.status = 'running'
+
+        try:
+            self.run(job)
+            job.status = 'done'
+        except Exception as err:
+            job.error = repr(err)
+            job.status = 'failed'
+
+        job.stage = ''
+        print('Job', job.key, job.status, '-', job.summary(), job.error or '')
+
+        for listener in self.listeners:
+            listener(job)
@@ -0,0 +1,77 @@
+import numpy as np
+from covid_schema import float_values
+
+'''
+=============================
+MAP PAYLOAD (STATIC GEOMETRY)
+=============================
+
+Each authority's position and name never change between interactions, so they
+are held once per data version as plain float / string arrays in area order.
+A map request only gathers them for the rows being shown and works out the
+metric dependent marker sizes and hover values. Hover values are sent as one
+matrix (counts, then any extra values such as the rolling rates), and the
+selected date goes into the hovertemplate rather than being repeated on every
+point. Extra values are formatted here, once per data version, so a missing
+one (no population, no growth) shows as '-' rather than NaN.
+'''
+
+coord_digits = 5  # ~1m, keeps the JSON short
+size_digits = 1
+missing_text = '-'
+
+
+class MapLayer:
+
+    def __init__(self, df_index, metrics, extras=None, lat_col='Latitude', lon_col='Longitude'):
+        # extras: column -> format string, for hover values shown as text
+        df = df_index.df
+        areas = df_index.areas()
+
+        # row -> area position
+        self.area_pos = np.empty(len(df), dtype=np.int32)
+        for i, a in enumerate(areas):
+            self.area_pos[df_index.area_positions[a]] = i
+
+        # latest coordinates per area
+        last = [df_index.area_positions[a][-1] for a in areas]
+        self.names = np.array(areas, dtype=object)
+        self.lat = np.round(float_values(df[lat_col])[last], coord_digits)
+        self.lon = np.round(float_values(df[lon_col])[last], coord_digits)
+
+        # metric values for every row, missing as 0
+        self.metrics = list(metrics)
+        self.values = {c: float_values(df[c], 0).astype(np.int64) for c in self.metrics}
+
+        # extra hover values (e.g. analytics) as text, missing as missing_text
+        extras = extras or {}
+        self.extras = list(extras)
+        self.values.update({
+            c: np.array([missing_text if np.isnan(v) else fmt.format(v) for v in float_values(df[c])], dtype=object)
+            for c, fmt in extras.items()
+        })
+
+    def center(self, pos=None):
+        g = self.area_pos[pos] if pos is not None and len(pos) else slice(None)
+        return dict(lat=float(np.nanmean(self.lat[g])), lon=float(np.nanmean(self.lon[g])))
+
+    def trace(self, pos, display, marker_col, max_size, hovertemplate):
+        # scattermapbox trace dict for rows pos, drawn in the order given (largest markers first)
+        g = self.area_pos[pos]
+
+        v = self.values[display][pos]
+        v_max = v.max() if len(v) else 0
+        sizes = np.round(v * max_size / v_max, size_digits) if v_max > 0 else np.zeros(len(v))
+
+        return dict(
+            type='scattermapbox',
+            lat=self.lat[g],
+            lon=self.lon[g],
+            mode='text+markers',
+            marker={'size': sizes, 'color': marker_col},
+            name='',
+            text=self.names[g],
+            textposition='top center',
+            customdata=np.column_stack([self.values[c][pos] for c in self.metrics + self.extras]),
+            hovertemplate=hovertemplate
+        )
@@ -0,0 +1,53 @@
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+'''
+=========================
+MEMORY REPORT PER PROCESS
+=========================
+
+Resident memory in MB from /proc. RssFile counts pages mapped from files (e.g.
+the memory-mapped data snapshot) which are shared between workers; Pss splits
+every shared page between the processes using it, so summing Pss over the
+gunicorn workers gives the real total. Without /proc (or the resource module,
+on Windows) the report is empty.
+'''
+
+rss_keys = ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem')
+
+
+def memory_usage():
+    info = {}
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in rss_keys:
+                    info[key] = int(value.split()[0]) / 1024
+
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'Pss':
+                    info[key] = int(value.split()[0]) / 1024
+
+    except OSError:
+        pass
+
+    if not info and resource is not None:
+        # no /proc - peak resident size is the best available (kB on linux)
+        info['MaxRSS'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return info
+
+
+def log_memory(label):
+    m = memory_usage()
+    print('[pid', str(os.getpid()) + ']', label, '-', ', '.join(k + ' {:.1f}MB'.format(v) for k, v in sorted(m.items())))
+
+    return m
@@ -0,0 +1,222 @@
+import os
+import time
+import bisect
+import functools
+import threading
+import figure_cache
+from flask import Response, g, has_request_context
+from dash.exceptions import PreventUpdate
+
+'''
+=========================================
+CALLBACK METRICS (PROMETHEUS TEXT FORMAT)
+=========================================
+
+Wrap a callback in instrument(name) (under @app.callback, over any memoize)
+and every call records, per callback:
+    dash_callback_seconds           wall time by phase - filter and build (marked with
+                                    lap() in the callback), other (the rest, e.g. a cache
+                                    lookup), serialize (Dash writing the JSON response)
+                                    and total
+    dash_callback_inputs            number of values selected across the list inputs
+    dash_callback_cache_total       figure cache lookups made by the call, hit or miss
+    dash_callback_calls_total       calls by outcome (ok, prevented, error)
+    dash_callback_response_bytes    size of the JSON response
+init_app(server) serves them at /metrics. Counts are per worker process (like
+/memory), so with gunicorn each scrape reads whichever worker answers.
+'''
+
+seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+inputs_buckets = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+bytes_buckets = (1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+
+
+def label_text(labels):
+    return '{' + ','.join(k + '="' + str(v).replace('"', '\\"') + '"' for k, v in labels) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}  # sorted label items -> count
+        self._lock = threading.Lock()
+
+    def inc(self, n=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def lines(self):
+        yield '# HELP ' + self.name + ' ' + self.help_text
+        yield '# TYPE ' + self.name + ' counter'
+
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                yield self.name + label_text(key) + ' ' + str(v)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._values = {}  # sorted label items -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def lines(self):
+        yield '# HELP ' + self.name + ' ' + self.help_text
+        yield '# TYPE ' + self.name + ' histogram'
+
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for le, n in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += n
+                    yield self.name + '_bucket' + label_text(key + (('le', le),)) + ' ' + str(cumulative)
+                yield self.name + '_sum' + label_text(key) + ' ' + repr(round(total, 6))
+                yield self.name + '_count' + label_text(key) + ' ' + str(cumulative)
+
+
+callback_seconds = Histogram('dash_callback_seconds', 'Callback wall time by phase.', seconds_buckets)
+callback_inputs = Histogram('dash_callback_inputs', 'Values selected across the list inputs.', inputs_buckets)
+callback_bytes = Histogram('dash_callback_response_bytes', 'Size of the JSON response.', bytes_buckets)
+callback_cache = Counter('dash_callback_cache_total', 'Cache lookups made by callbacks.')
+callback_calls = Counter('dash_callback_calls_total', 'Callback calls by outcome.')
+job_seconds = Histogram('covid_job_stage_seconds', 'Background data load time by stage.', seconds_buckets)
+
+registry = [callback_seconds, callback_inputs, callback_bytes, callback_cache, callback_calls, job_seconds]
+
+_local = threading.local()  # the call being timed on this thread
+
+
+'''
+=================
+TIMING A CALLBACK
+=================
+'''
+
+
+def cardinality(args):
+    # values selected across the list inputs (a cleared multi-select arrives as None)
+    return sum(len(a) for a in args if isinstance(a, (list, tuple)))
+
+
+def lap(phase):
+    # time since the call started (or the last lap) goes to phase; no-op outside an instrumented call
+    call = getattr(_local, 'call', None)
+    if call is None:
+        return
+
+    now = time.perf_counter()
+    call['phases'][phase] = call['phases'].get(phase, 0) + now - call['last']
+    call['last'] = now
+
+
+def cache_lookup(cache, hit):
+    # figure_cache lookup listener - counted against the callback making the lookup
+    call = getattr(_local, 'call', None)
+    if call is not None:
+        callback_cache.inc(callback=call['name'], cache=cache, result='hit' if hit else 'miss')
+
+
+figure_cache.lookup_listeners.append(cache_lookup)
+
+
+def instrument(name):
+    # goes under @app.callback and over figure_cache.memoize, so cache hits are timed too
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            t0 = time.perf_counter()
+            call = _local.call = {'name': name, 'phases': {}, 'last': t0}
+            outcome = 'error'
+
+            try:
+                value = func(*args)
+                outcome = 'ok'
+                return value
+
+            except PreventUpdate:
+                outcome = 'prevented'
+                raise
+
+            finally:
+                _local.call = None
+                end = time.perf_counter()
+
+                for phase, secs in call['phases'].items():
+                    callback_seconds.observe(secs, callback=name, phase=phase)
+                callback_seconds.observe(end - call['last'], callback=name, phase='other')
+
+                callback_inputs.observe(cardinality(args), callback=name)
+                callback_calls.inc(callback=name, outcome=outcome)
+
+                if outcome == 'ok' and has_request_context():
+                    # serialize and total are recorded once Dash has written the response
+                    g.dash_callback = (name, t0, end)
+                else:
+                    callback_seconds.observe(end - t0, callback=name, phase='total')
+
+        return wrapper
+
+    return decorator
+
+
+def record_response(response):
+    # after_request: JSON serialisation happens in Dash after the callback returns
+    timed = getattr(g, 'dash_callback', None)
+    if timed is None:
+        return response
+
+    name, t0, end = timed
+    now = time.perf_counter()
+    g.dash_callback = None
+
+    callback_seconds.observe(now - end, callback=name, phase='serialize')
+    callback_seconds.observe(now - t0, callback=name, phase='total')
+
+    if not response.direct_passthrough:
+        callback_bytes.observe(response.calculate_content_length() or 0, callback=name)
+
+    return response
+
+
+def record_job(job):
+    # covid_jobs listener - stage timings of a finished background load
+    for stage, secs in job.timings:
+        job_seconds.observe(secs, stage=stage)
+
+
+'''
+================
+METRICS ENDPOINT
+================
+'''
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.lines())
+
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(server):
+    server.after_request(record_response)
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4', headers={'X-Worker-Pid': str(os.getpid())})
+
+    return server
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import shutil
+import threading
+import urllib.request
+import pandas as pd
+import covid_store
+import covid_schema
+
+'''
+==============================
+MSOA FEED CACHE (DISK, SHARED)
+==============================
+
+The MSOA release (every local area x every date) is downloaded once into
+data/msoa/msoa.csv and shared by all workers. It is re-checked every
+COVID_MSOA_MAX_AGE seconds with a conditional request (ETag / Last-Modified),
+so an unchanged release is not downloaded again. A failed or invalid download
+never replaces the cache - the last good copy keeps being served and the fetch
+is retried after retry_after seconds.
+
+COVID_MSOA_SOURCE may point at a local csv instead of the API (for testing or
+offline use); it is then re-copied only when its modification time changes.
+'''
+
+msoa_url = 'https://api.coronavirus.data.gov.uk/v2/data?areaType=msoa&metric=newCasesBySpecimenDateRollingSum&metric=newCasesBySpecimenDateRollingRate&metric=newCasesBySpecimenDateChange&metric=newCasesBySpecimenDateChangePercentage&metric=newCasesBySpecimenDateDirection&format=csv'
+
+source = os.environ.get('COVID_MSOA_SOURCE', msoa_url)
+max_age = int(os.environ.get('COVID_MSOA_MAX_AGE', 6 * 60 * 60))  # seconds
+retry_after = 10 * 60  # seconds between attempts after a failed fetch
+timeout = 120  # seconds
+
+cache_dir = os.path.join(covid_store.data_dir, 'msoa')
+cache_file = os.path.join(cache_dir, 'msoa.csv')
+meta_file = os.path.join(cache_dir, 'msoa.json')
+lock_file = os.path.join(cache_dir, 'msoa.lock')
+
+required_columns = ['date', 'areaName', 'LtlaName', 'newCasesBySpecimenDateRollingSum']
+
+
+def cache_lock():
+    # one download at a time across threads and worker processes
+    return covid_store.file_lock(lock_file)
+
+
+def read_meta():
+    if not os.path.exists(meta_file):
+        return {}
+
+    with open(meta_file) as f:
+        return json.load(f)
+
+
+def write_meta(meta):
+    tmp = meta_file + '.tmp'
+
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+
+    os.replace(tmp, meta_file)
+
+
+def cache_mtime():
+    try:
+        return os.path.getmtime(cache_file)
+    except OSError:
+        return None
+
+
+def is_stale(meta, now=None):
+    now = now or time.time()
+
+    if not os.path.exists(cache_file) or meta.get('source') != source:
+        return True
+    if now - meta.get('failed', 0) < retry_after:
+        return False
+
+    return now - meta.get('checked', 0) >= max_age
+
+
+def validate(file):
+    # a truncated download or an error page must not replace the last good copy
+    columns = pd.read_csv(file, nrows=5).columns
+    missing = [c for c in required_columns if c not in columns]
+
+    if missing:
+        raise ValueError('MSOA download is missing columns: ' + ', '.join(missing))
+
+
+def download(meta):
+    # new release into cache_file; returns the updated meta, or None if the source has not changed
+    tmp = cache_file + '.tmp'
+    cached = os.path.exists(cache_file) and meta.get('source') == source
+
+    if '://' not in source:
+        mtime = os.path.getmtime(source)
+
+        if cached and meta.get('mtime') == mtime:
+            return None
+
+        shutil.copyfile(source, tmp)
+        new_meta = {'mtime': mtime}
+
+    else:
+        request = urllib.request.Request(source)
+
+        if cached and meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if cached and meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response, open(tmp, 'wb') as f:
+                shutil.copyfileobj(response, f, 1 << 20)
+                new_meta = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+
+        except urllib.request.HTTPError as err:
+            if err.code == 304:
+                return None
+            raise
+
+    try:
+        validate(tmp)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+    os.replace(tmp, cache_file)
+    new_meta['source'] = source
+
+    return new_meta
+
+
+def refresh(force=False):
+    # re-check the source if the cache is stale; True if cache_file was replaced
+    with cache_lock():
+        meta = read_meta()  # re-read under the lock - another worker may have just refreshed
+        now = time.time()
+
+        if not force and not is_stale(meta, now):
+            return False
+
+        try:
+            new_meta = download(meta)
+
+        except Exception as err:
+            if not os.path.exists(cache_file):
+                raise
+
+            print('MSOA fetch failed, serving cached copy from', meta.get('updated'), '-', repr(err))
+            meta['failed'] = now
+            write_meta(meta)
+
+            return False
+
+        if new_meta is None:
+            meta.update({'checked': now, 'failed': 0})
+            write_meta(meta)
+            return False
+
+        new_meta.update({'checked': now, 'failed': 0, 'updated': time.strftime('%Y-%m-%d %H:%M:%S')})
+        write_meta(new_meta)
+        print('MSOA cache updated from', source)
+
+        return True
+
+
+def read_cache():
+    return covid_schema.apply_schema(pd.read_csv(cache_file))
+
+
+def load():
+    # cached frame, downloading first only if there is no cache yet
+    if not os.path.exists(cache_file):
+        refresh(force=True)
+
+    return read_cache()
+
+
+'''
+=========================
+MSOA FEED FOR A DASHBOARD
+=========================
+
+build(df) turns the cached frame into what the callbacks need. refresh() is
+cheap enough to call before every request: when the cache is stale, or another
+worker has updated it, the fetch and rebuild run on a background thread and the
+new data is published with a single reference swap.
+'''
+
+
+class MsoaFeed:
+
+    def __init__(self, build, check_every=60):
+        self.build = build
+        self.check_every = check_every  # seconds between cache checks
+        self.current = None
+        self._mtime = None
+        self._checked = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        df = load()
+        self._mtime = cache_mtime()
+        self.current = self.build(df)
+
+        return self.current
+
+    def refresh(self):
+        now = time.time()
+
+        if now - self._checked < self.check_every:
+            return False
+
+        self._checked = now
+
+        if cache_mtime() == self._mtime and not is_stale(read_meta(), now):
+            return False
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+
+            self._thread = threading.Thread(target=self._update, daemon=True)
+            self._thread.start()
+
+        return True
+
+    def _update(self):
+        try:
+            refresh()
+            mtime = cache_mtime()
+
+            if mtime != self._mtime:
+                data = self.build(read_cache())
+                self._mtime = mtime
+                self.current = data
+                print('Reloaded MSOA data')
+
+        except Exception as err:
+            print('MSOA refresh failed -', repr(err))
+
+
+if __name__ == '__main__':
+    # python covid_msoa.py - force a conditional re-check now
+    updated = refresh(force=True)
+    print('updated' if updated else 'unchanged', json.dumps(read_meta(), indent=2, sort_keys=True))
@@ -0,0 +1,55 @@
+import numpy as np
+from covid_schema import float_values
+
+'''
+============================
+RANKINGS PER DATE AND METRIC
+============================
+
+Built once per data version: for every metric, the rows of each date ordered
+largest first (missing values last), with each row's rank. A top-N for all
+areas is then a slice of the first N positions of the date's block, and a
+selection of areas is put in order by looking up the selected rows' ranks.
+'''
+
+
+class RankIndex:
+
+    def __init__(self, df_index, metrics):
+        self.df_index = df_index
+        self.order = {}  # metric -> row positions, date blocks in place, each block largest first
+        self.rank = {}  # metric -> row -> position in order
+
+        date_pos = df_index.row_dates()
+        rows = np.arange(len(df_index.df), dtype=np.int32)
+
+        for c in metrics:
+            values = float_values(df_index.df[c])
+
+            # by date, then value descending (-NaN is NaN, which sorts last), then row - one stable pass for all dates
+            order = np.lexsort((rows, -values, date_pos)).astype(np.int32)
+            rank = np.empty(len(order), dtype=np.int32)
+            rank[order] = rows
+
+            self.order[c] = order
+            self.rank[c] = rank
+
+    def top(self, d, metric, n=None):
+        # row positions of the n largest values of metric on date d
+        rows = self.df_index.date_slice(d)
+        stop = rows.stop if n is None else min(rows.start + n, rows.stop)
+
+        return self.order[metric][rows.start:stop]
+
+    def ranked(self, pos, metric, n=None):
+        # rows pos (all from one date) in rank order, first n
+        pos = np.asarray(pos)
+
+        return pos[np.argsort(self.rank[metric][pos], kind='stable')][:n]
+
+    def select(self, d, metric, areas=None, n=None):
+        # top n rows for date d over all areas, or over the selected areas
+        if not areas:
+            return self.top(d, metric, n)
+
+        return self.ranked(self.df_index.positions(d, areas), metric, n)
@@ -0,0 +1,163 @@
+import copy
+import numpy as np
+import pandas as pd
+from covid_analytics import day_matrix, fill_gaps
+from covid_schema import date_strings, date_value, float_values
+
+'''
+================================
+DAILY / WEEKLY / MONTHLY ROLLUPS
+================================
+
+The full history (from history_start) of one value per area is held as a
+day x area matrix, plus weekly (Monday start) and monthly rollups of it, built
+once per data load. A chart asks for a span of days and gets the finest
+resolution that keeps it under max_points points per line, so a two year view
+sends about a hundred weekly points instead of 700 daily ones.
+
+Counts are by publish date. A day GovUK did not publish (weekends from 2022)
+is left out of the daily level, as the original charts did, and counts as 0
+new cases in the weekly and monthly averages, since the next release carries
+them. Weekly and monthly values are the average per day over each area's days
+from its first to its last row. So all three resolutions are on the same
+scale, a part period at either end is not understated, and a period with no
+data at all is NaN, not 0.
+
+On a reload, extended() adds the new days to a copy and recomputes only the
+periods from the first day they change (the day after an area's previous last
+row); the earlier periods are copied across.
+'''
+
+history_start = '2020-08-12'  # data available from this date
+max_points = 120
+
+
+def period_mean(m, starts):
+    # mean over the rows of m from each start to the next, ignoring NaN (NaN if the period has no data)
+    present = ~np.isnan(m)
+    total = np.add.reduceat(np.where(present, m, 0), starts, axis=0)
+    count = np.add.reduceat(present, starts, axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class Rollups:
+
+    def __init__(self, df, value_col, area_col='areaName', start=history_start):
+        # df sorted by date
+        df = df.iloc[df['date'].searchsorted(date_value(df['date'], start)):]
+        m, day, code, areas = day_matrix(df, value_col, area_col)
+
+        self.value_col = value_col
+        self.area_col = area_col
+        self.day0 = pd.to_datetime(df['date']).values.min()
+        self.set_matrix(m, areas)
+
+    def extended(self, df):
+        # a copy with the rows of df (sorted by date, all after the last day held) added
+        if not df.shape[0]:
+            return self
+
+        dates = pd.to_datetime(df['date']).values
+        day = ((dates - self.day0) // np.timedelta64(1, 'D')).astype(np.int64)
+        values = df[self.area_col].astype(object)
+        areas = list(self.areas) + sorted(set(values) - set(self.areas))  # new areas go on the end
+
+        m = np.full((max(self.days, day.max() + 1), len(areas)), np.nan)
+        m[:self.days, :len(self.areas)] = self.raw
+        m[day, pd.Index(areas).get_indexer(values)] = float_values(df[self.value_col])
+
+        rollups = copy.copy(self)
+        rollups.set_matrix(m, areas, previous=self)
+
+        return rollups
+
+    def set_matrix(self, m, areas, previous=None):
+        # (days, areas) matrix from day0; periods before the first day that differs from previous are copied from it
+        present = ~np.isnan(m)
+        days = pd.date_range(self.day0, periods=m.shape[0], freq='D')
+        has_rows = present.any(axis=0)
+
+        self.raw = m
+        self.areas = {a: i for i, a in enumerate(areas)}
+        self.days = len(days)
+        self.calendar = date_strings(days.values)  # every day, published or not
+        self.first_row = np.where(has_rows, present.argmax(axis=0), len(days))
+        self.last_row = np.where(has_rows, len(days) - 1 - present[::-1].argmax(axis=0), -1)
+
+        # new rows also turn the gap after an area's last row into 0s
+        first = 0
+        if previous is not None:
+            n = len(previous.last_row)
+            moved = self.last_row[:n] != previous.last_row
+            first = int(np.concatenate([[previous.days], previous.last_row[moved] + 1, self.first_row[n:]]).min())
+
+        published = np.flatnonzero(present.any(axis=1))  # days with a row for any area
+        weeks = np.union1d([0], np.flatnonzero(days.weekday == 0))
+        months = np.union1d([0], np.flatnonzero(days.day == 1))
+
+        # resolution -> (period start dates, (periods, areas) matrix)
+        self.levels = {}
+
+        for res, starts in (('daily', published), ('weekly', weeks), ('monthly', months)):
+            if res == 'daily':
+                k = int(np.searchsorted(starts, first))  # first published day from first
+            else:
+                k = max(0, int(np.searchsorted(starts, first, side='right')) - 1)  # period containing first
+
+            cut = starts[k] if k < len(starts) else len(days)
+            filled = fill_gaps(m[cut:], self.first_row < cut)
+
+            if res == 'daily':
+                tail = filled[starts[k:] - cut]
+            else:
+                tail = period_mean(filled, starts[k:] - cut)
+
+            if k:
+                head = previous.levels[res][1][:k]
+                tail = np.vstack([np.hstack([head, np.full((k, len(areas) - head.shape[1]), np.nan)]), tail])
+
+            self.levels[res] = (date_strings(days.values[starts]), tail)
+
+    def resolution(self, span=None):
+        # finest resolution that shows span days (no more than there are) in at most max_points points
+        span = min(span or self.days, self.days)
+
+        if span <= max_points:
+            return 'daily'
+        if span <= max_points * 7:
+            return 'weekly'
+        return 'monthly'
+
+    def window(self, span=None):
+        # resolution, period start dates and first period for the last span days
+        res = self.resolution(span)
+        x, m = self.levels[res]
+
+        if not span or span >= self.days:
+            return res, x, 0
+
+        first_day = self.calendar[self.days - span]
+
+        if res == 'daily':
+            first = int(np.searchsorted(x, first_day))  # first published day in the span
+        else:
+            first = max(0, int(np.searchsorted(x, first_day, side='right')) - 1)  # period containing first_day
+
+        return res, x[first:], first
+
+    def series(self, areas, span=None):
+        # resolution, x and (periods, areas) matrix for the last span days of the areas that have data
+        res, x, first = self.window(span)
+        areas = [a for a in dict.fromkeys(areas) if a in self.areas]
+        m = self.levels[res][1]
+
+        return res, x, areas, m[first:, [self.areas[a] for a in areas]]
+
+    def total(self, span=None):
+        # resolution, x and values summed over all areas (NaN where no area has data)
+        res, x, first = self.window(span)
+        m = self.levels[res][1][first:]
+
+        return res, x, np.where(np.isnan(m).all(axis=1), np.nan, np.nansum(m, axis=1))
@@ -0,0 +1,178 @@
+import sys
+import numpy as np
+import pandas as pd
+
+'''
+===============================
+COMPACT DTYPES FOR COVID FRAMES
+===============================
+
+Applied at load time to the LTLA, totals and MSOA frames:
+    date                -> datetime64
+    area / region names -> category
+    counts              -> int32 (nullable Int32 only where there are gaps)
+    rates / lat / long  -> float32
+    direction           -> category over UP / DOWN / SAME
+
+Columns already in their compact dtype are left untouched (no copy), so it is
+safe to apply to a memory-mapped snapshot.
+
+python covid_schema.py <file.csv|.parquet> prints a before/after memory report.
+'''
+
+category_columns = [
+    'areaType',
+    'areaCode',
+    'areaName',
+    'regionCode',
+    'regionName',
+    'UtlaCode',
+    'UtlaName',
+    'LtlaCode',
+    'LtlaName'
+]
+
+count_columns = [
+    'cumCasesByPublishDate',
+    'newCasesByPublishDate',
+    'newDeaths28DaysByPublishDate',
+    'cumDeaths28DaysByPublishDate',
+    'newCasesBySpecimenDateRollingSum',
+    'newCasesBySpecimenDateChange'
+]
+
+float_columns = [
+    'Latitude',
+    'Longitude',
+    'newCasesBySpecimenDateRollingRate',
+    'newCasesBySpecimenDateChangePercentage'
+]
+
+directions = ['UP', 'DOWN', 'SAME']
+
+
+def to_datetime(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, format='%Y-%m-%d')
+
+
+def to_category(s):
+    if pd.api.types.is_categorical_dtype(s):
+        return s
+    return s.astype('category')
+
+
+def to_direction(s):
+    if pd.api.types.is_categorical_dtype(s) and list(s.cat.categories) == directions:
+        return s
+    return pd.Series(pd.Categorical(s, categories=directions), index=s.index)
+
+
+def to_int32(s):
+    if str(s.dtype) in ('int32', 'Int32'):
+        return s
+
+    s = pd.to_numeric(s, errors='coerce')
+
+    if s.isna().any():
+        return s.astype('Int32')
+    return s.astype('int32')
+
+
+def to_float32(s):
+    if s.dtype == np.float32:
+        return s
+    return pd.to_numeric(s, errors='coerce').astype('float32')
+
+
+schema = {'date': to_datetime, 'newCasesBySpecimenDateDirection': to_direction}
+schema.update({c: to_category for c in category_columns})
+schema.update({c: to_int32 for c in count_columns})
+schema.update({c: to_float32 for c in float_columns})
+
+
+def apply_schema(df, dataset=None):
+    # dataset is accepted so this can be used as a per-dataset loader hook
+    df = df.copy(deep=False)
+
+    for c, convert in schema.items():
+        if c in df.columns:
+            df[c] = convert(df[c])
+
+    return df
+
+
+'''
+===========
+DATE VALUES
+===========
+
+Callbacks receive dates as 'YYYY-MM-DD' strings.
+'''
+
+
+def date_str(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def date_strings(values):
+    values = np.asarray(values)
+
+    if np.issubdtype(values.dtype, np.datetime64):
+        return list(np.datetime_as_string(values, unit='D'))
+    return [str(v)[:10] for v in values]
+
+
+def date_value(s, d):
+    # d in the same representation as column s, for comparisons and searchsorted
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return np.datetime64('NaT') if d is None else np.datetime64(d, 'ns')
+    return d
+
+
+def float_values(s, fill_value=np.nan):
+    # float64 array of s with missing values as fill_value (Series.to_numpy(na_value=...) needs pandas 1.0)
+    values = s.astype('float64').values
+
+    if not np.isnan(fill_value):
+        values = np.where(np.isnan(values), fill_value, values)
+
+    return values
+
+
+'''
+=============
+MEMORY REPORT
+=============
+'''
+
+
+def memory_report(df_before, df_after):
+    before = df_before.memory_usage(index=False, deep=True)
+    after = df_after.memory_usage(index=False, deep=True)
+
+    report = pd.DataFrame({
+        'before_dtype': df_before.dtypes.astype(str),
+        'after_dtype': df_after.dtypes.astype(str),
+        'before_MB': before / 1e6,
+        'after_MB': after / 1e6
+    })
+    report.loc['TOTAL', ['before_MB', 'after_MB']] = [before.sum() / 1e6, after.sum() / 1e6]
+
+    return report
+
+
+if __name__ == '__main__':
+    file = sys.argv[1]
+
+    if file.endswith('.parquet'):
+        df_raw = pd.read_parquet(file)
+    else:
+        df_raw = pd.read_csv(file)
+
+    df_compact = apply_schema(df_raw)
+    r = memory_report(df_raw, df_compact)
+
+    print(r.round(3).to_string())
+    print('{:.1f}x smaller'.format(r.loc['TOTAL', 'before_MB'] / r.loc['TOTAL', 'after_MB']))
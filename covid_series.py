@@ -0,0 +1,71 @@
+import numpy as np
+from figure_cache import FigureCache
+from covid_schema import float_values
+
+'''
+===============================
+TIME SERIES BY AREA (DATE AXIS)
+===============================
+
+Line charts need one value per date for each selected area. SeriesMatrix
+scatters the rows of all requested areas into a date x area matrix in one
+vectorized step (with the fill policy applied) and keeps each area's column, so
+later requests only slice arrays. Traces are returned as plain dicts - the
+layout is validated once by go.Figure, and 50 lines cost little more than one.
+'''
+
+
+class SeriesMatrix:
+
+    def __init__(self, df_index, value_col, fill_value=None, max_areas=1024):
+        self.df_index = df_index
+        self.dates = df_index.dates()
+        self.fill_value = fill_value  # None leaves missing values as gaps in the line
+
+        self.date_pos = df_index.row_dates()  # row -> position on the date axis
+
+        self.values = float_values(df_index.df[value_col])
+        self._columns = FigureCache(max_items=max_areas, name='series_columns')
+
+    def matrix(self, areas):
+        # (dates, areas) array; areas must be in the index
+        columns = {a: self._columns.get(a) for a in areas}
+        missing = [a for a, col in columns.items() if col is None]
+
+        if missing:
+            pos = [self.df_index.area_positions[a] for a in missing]
+            rows = np.concatenate(pos)
+            cols = np.repeat(np.arange(len(missing)), [len(p) for p in pos])
+
+            m = np.full((len(missing), len(self.dates)), np.nan)
+            m[cols, self.date_pos[rows]] = self.values[rows]
+
+            if self.fill_value is not None:
+                m[np.isnan(m)] = self.fill_value
+
+            for a, col in zip(missing, m):
+                columns[a] = col
+                self._columns.put(a, col)
+
+        return np.column_stack([columns[a] for a in areas]) if areas else np.empty((len(self.dates), 0))
+
+    def traces(self, areas, hovertemplate='%{y}', named=True, **style):
+        areas = [a for a in dict.fromkeys(areas) if self.df_index.has_area(a)]
+
+        return line_traces(self.dates, self.matrix(areas), areas, hovertemplate, named, **style)
+
+
+def line_traces(x, m, areas, hovertemplate='%{y}', named=True, **style):
+    # one scatter trace dict per column of m; '{area}' in hovertemplate is replaced by the area name
+    return [
+        dict(
+            type='scatter',
+            mode='lines',
+            name=a if named else '',
+            x=x,
+            y=m[:, j],
+            hovertemplate=hovertemplate.replace('{area}', a),
+            **style
+        )
+        for j, a in enumerate(areas)
+    ]
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import hashlib
+import pyarrow as pa
+import pandas as pd
+from pandas.api.types import union_categoricals
+import covid_store
+import covid_schema
+
+'''
+==================================
+LOCAL DATASET SNAPSHOT (VERSIONED)
+==================================
+
+One Arrow IPC file per dataset, built from the parquet partitions and recorded
+in snapshot.json with the store version and a sha256 of its content. Workers
+read the snapshot instead of downloading the xlsx files from GitHub; the remote
+copy is only used when COVID_REMOTE_FALLBACK=1 (or remote=True) and there is no
+usable local data.
+
+The snapshot is memory-mapped rather than read, so the numeric columns are
+backed by the OS page cache and every gunicorn worker shares the same pages.
+The rows are stored in the compact covid_schema dtypes, sorted by
+(date, areaName), so the apps can index and window them without taking a copy.
+
+Workers that find the snapshot stale (e.g. all of them with COVID_STARTUP=lazy,
+or on a hot reload) take the snapshot lock in turn: the first rebuilds it, the
+rest find it current once they get the lock and just map it. When the store
+has only gained days after the snapshot's last date, just the new partitions
+are read, converted and sorted; the file itself is still rewritten (the mapped
+old rows copied across, then the new ones) and hashed again, as an Arrow file
+cannot be extended in place. A dataset with no new days keeps its file.
+Anything else (a backfill of an earlier day, a partition written again)
+rebuilds the dataset from the store.
+'''
+
+snapshot_dir = os.path.join(covid_store.data_dir, 'snapshot')
+manifest_file = os.path.join(snapshot_dir, 'snapshot.json')
+lock_file = os.path.join(snapshot_dir, '.snapshot.lock')
+
+remote_files = {
+    'daily': 'https://github.com/waiky8/ukcovid-19/blob/main/covid_data.xlsx?raw=true',
+    'totals': 'https://github.com/waiky8/ukcovid-19/blob/main/covid_totals.xlsx?raw=true'
+}
+
+remote_fallback = os.environ.get('COVID_REMOTE_FALLBACK', '') == '1'
+
+
+def snapshot_file(dataset):
+    return os.path.join(snapshot_dir, dataset + '.arrow')
+
+
+def file_hash(file):
+    h = hashlib.sha256()
+
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def snapshot_lock():
+    # serialises snapshot builds between threads and between worker processes
+    return covid_store.file_lock(lock_file)
+
+
+def read_manifest():
+    if not os.path.exists(manifest_file):
+        return {'version': None, 'datasets': {}}
+
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest):
+    tmp = covid_store.tmp_name(manifest_file)
+
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    os.replace(tmp, manifest_file)
+
+
+def write_arrow(df, file):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = covid_store.tmp_name(file)
+
+    with pa.OSFile(tmp, 'wb') as sink:
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+    os.replace(tmp, file)
+
+
+def read_arrow(file):
+    # split_blocks keeps one block per column so null-free numeric columns stay zero-copy views of the map
+    source = pa.memory_map(file, 'r')
+    table = pa.ipc.open_file(source).read_all()
+
+    return table.to_pandas(split_blocks=True)
+
+
+'''
+==============
+BUILD SNAPSHOT
+==============
+'''
+
+
+def read_frame(dataset, dates):
+    # partitions for dates in the compact dtypes, sorted by (date, areaName)
+    if not dates:
+        return covid_schema.apply_schema(pd.DataFrame(columns=covid_store.datasets[dataset]['columns']))
+
+    df = pd.concat([covid_store.read_partition(dataset, d) for d in dates], ignore_index=True)
+    df = covid_schema.apply_schema(df)
+
+    return df.sort_values(by=['date', 'areaName'], kind='mergesort').reset_index(drop=True)
+
+
+def append_rows(df, new):
+    # df followed by the rows of new (a new frame - the caller writes it out in full);
+    # categories are merged and kept sorted, as a fresh build has them
+    columns = {}
+
+    for c in df.columns:
+        if pd.api.types.is_categorical_dtype(df[c]) and pd.api.types.is_categorical_dtype(new[c]):
+            columns[c] = pd.Series(union_categoricals([df[c], new[c]], sort_categories=True))
+        else:
+            columns[c] = pd.concat([df[c], new[c]], ignore_index=True)
+
+    return covid_schema.apply_schema(pd.DataFrame(columns))
+
+
+def build_snapshot(previous=None):
+    # call under snapshot_lock()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = previous or read_manifest()
+    store = covid_store.read_manifest()
+    manifest = {'version': store['version'], 'datasets': {}}
+
+    for dataset in covid_store.datasets:
+        # the file mtime catches a partition written again within the manifest's one second resolution
+        partitions = {
+            d: dict(p, mtime=os.path.getmtime(covid_store.partition_file(dataset, d)))
+            for d, p in store['datasets'].get(dataset, {}).items()
+        }
+        dates = sorted(partitions)
+        entry = previous['datasets'].get(dataset) or {}
+        old = entry.get('partitions') or {}
+        file = snapshot_file(dataset)
+
+        # every partition in the snapshot is still in the store as it was written
+        unchanged = old and all(partitions.get(d) == p for d, p in old.items()) and os.path.exists(file) \
+            and file_hash(file) == entry['sha256']
+        new_dates = [d for d in dates if d not in old]
+
+        if unchanged and not new_dates:
+            manifest['datasets'][dataset] = entry
+            continue
+
+        if unchanged and new_dates[0] > max(old):
+            df = append_rows(read_arrow(file), read_frame(dataset, new_dates))
+        else:
+            df = read_frame(dataset, dates)
+
+        write_arrow(df, file)
+
+        manifest['datasets'][dataset] = {
+            'file': os.path.basename(file),
+            'sha256': file_hash(file),
+            'rows': int(df.shape[0]),
+            'date_max': covid_schema.date_str(df['date'].max()) if df.shape[0] else None,
+            'partitions': partitions
+        }
+
+    write_manifest(manifest)
+
+    return manifest
+
+
+def snapshot_ok(manifest, dataset, verify=True):
+    entry = manifest['datasets'].get(dataset)
+    file = snapshot_file(dataset)
+
+    if entry is None or not os.path.exists(file):
+        return False
+
+    if verify and file_hash(file) != entry['sha256']:
+        print('Snapshot hash mismatch:', file)
+        return False
+
+    return True
+
+
+'''
+=============
+LOAD SNAPSHOT
+=============
+'''
+
+
+def load_snapshot(dataset, remote=None, verify=True):
+    # verify=False skips the content hash, e.g. on a reload of a snapshot a sibling worker has just written
+    remote = remote_fallback if remote is None else remote
+
+    covid_store.ensure_store()
+    manifest = read_manifest()
+    ok = snapshot_ok(manifest, dataset, verify)
+
+    # rebuild when the store has moved on since the snapshot was taken
+    if covid_store.list_dates(dataset) and (not ok or manifest['version'] != covid_store.data_version()):
+        try:
+            with snapshot_lock():
+                # another worker may have rebuilt it while this one waited for the lock
+                manifest = read_manifest()
+                if not snapshot_ok(manifest, dataset, verify) or manifest['version'] != covid_store.data_version():
+                    build_snapshot(manifest)
+            ok = True
+        except OSError as err:
+            print('Unable to write snapshot:', err)
+            return covid_schema.apply_schema(covid_store.read_dataset(dataset))
+
+    if ok:
+        return read_arrow(snapshot_file(dataset))
+
+    if remote:
+        print('No local', dataset, 'data - fetching', remote_files[dataset])
+        df = covid_schema.apply_schema(covid_store.normalise(dataset, pd.read_excel(remote_files[dataset])))
+        return df.sort_values(by=['date', 'areaName'], kind='mergesort').reset_index(drop=True)
+
+    raise FileNotFoundError('No local ' + dataset + ' data in ' + covid_store.data_dir)
+
+
+if __name__ == '__main__':
+    # python covid_snapshot.py - rebuild the snapshot from the data store
+    with snapshot_lock():
+        m = build_snapshot()
+    json.dump(m, sys.stdout, indent=2, sort_keys=True)
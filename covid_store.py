@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows (e.g. running the loader locally)
+    fcntl = None
+    import msvcrt
+
+'''
+====================================================
+COLUMNAR DATA STORE (ONE PARQUET PARTITION PER DATE)
+====================================================
+
+data/
+    manifest.json
+    daily/date=2021-01-31.parquet
+    totals/date=2021-01-31.parquet
+
+The xlsx files are kept as an optional export only - see export_excel().
+'''
+
+data_dir = os.environ.get('COVID_DATA_DIR', 'data')
+
+datasets = {
+    'daily': {
+        'excel': 'covid_data.xlsx',
+        'columns': [
+            'date',
+            'areaType',
+            'areaCode',
+            'areaName',
+            'cumCasesByPublishDate',
+            'newCasesByPublishDate',
+            'newDeaths28DaysByPublishDate',
+            'cumDeaths28DaysByPublishDate',
+            'Latitude',
+            'Longitude'
+        ]
+    },
+    'totals': {
+        'excel': 'covid_totals.xlsx',
+        'columns': [
+            'date',
+            'areaType',
+            'areaCode',
+            'areaName',
+            'cumCasesByPublishDate',
+            'newCasesByPublishDate',
+            'newDeaths28DaysByPublishDate',
+            'cumDeaths28DaysByPublishDate'
+        ]
+    }
+}
+
+numeric_columns = [
+    'cumCasesByPublishDate',
+    'newCasesByPublishDate',
+    'newDeaths28DaysByPublishDate',
+    'cumDeaths28DaysByPublishDate',
+    'Latitude',
+    'Longitude'
+]
+
+partition_prefix = 'date='
+partition_suffix = '.parquet'
+
+manifest_file = os.path.join(data_dir, 'manifest.json')
+manifest_lock_file = os.path.join(data_dir, '.manifest.lock')
+_thread_locks = {}  # lock file -> lock held by the thread holding it in this process
+_thread_locks_lock = threading.Lock()
+
+'''
+==========
+PARTITIONS
+==========
+'''
+
+
+def dataset_dir(dataset):
+    return os.path.join(data_dir, dataset)
+
+
+def partition_file(dataset, d):
+    return os.path.join(dataset_dir(dataset), partition_prefix + d + partition_suffix)
+
+
+def scan_partitions(dataset):
+    path = dataset_dir(dataset)
+
+    if not os.path.isdir(path):
+        return []
+
+    dates = [
+        f[len(partition_prefix):-len(partition_suffix)]
+        for f in os.listdir(path)
+        if f.startswith(partition_prefix) and f.endswith(partition_suffix)
+    ]
+
+    return sorted(dates)
+
+
+def list_dates(dataset):
+    return sorted(read_manifest()['datasets'].get(dataset, {}))
+
+
+def normalise(dataset, df):
+    # dates are held as 'YYYY-MM-DD' strings throughout the apps; lat/long can come back from excel as text
+    columns = datasets[dataset]['columns']
+    df = df.reindex(columns=columns)
+
+    if pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+    else:
+        df['date'] = df['date'].astype(str).str[:10]
+
+    for c in numeric_columns:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+
+    return df
+
+
+def write_partition(dataset, d, df):
+    # append-only: a new day is one new file, written to a temp name and renamed into place,
+    # then published in the manifest - a crash part way leaves the existing data untouched
+    df = normalise(dataset, df)
+    df = df[df['date'] == d]
+
+    os.makedirs(dataset_dir(dataset), exist_ok=True)
+    file = partition_file(dataset, d)
+    tmp = tmp_name(file)
+
+    df.to_parquet(tmp, engine='pyarrow', index=False)
+    os.replace(tmp, file)
+
+    with manifest_lock():
+        manifest = read_manifest()
+        manifest['datasets'].setdefault(dataset, {})[d] = {
+            'rows': int(df.shape[0]),
+            'written': datetime.now().isoformat(timespec='seconds')
+        }
+        manifest['version'] += 1
+        write_manifest(manifest)
+
+    return df.shape[0]
+
+
+def read_partition(dataset, d):
+    return pd.read_parquet(partition_file(dataset, d), engine='pyarrow')
+
+
+def read_dataset(dataset, date_from=None, date_to=None):
+    dates = [
+        d for d in list_dates(dataset)
+        if (date_from is None or d >= date_from) and (date_to is None or d <= date_to)
+    ]
+
+    if not dates:
+        return pd.DataFrame(columns=datasets[dataset]['columns'])
+
+    return pd.concat([read_partition(dataset, d) for d in dates], ignore_index=True)
+
+
+def data_version():
+    # bumped whenever a partition is written to either dataset
+    return read_manifest()['version']
+
+
+'''
+========
+MANIFEST
+========
+
+data/manifest.json lists every published partition. Readers only see a day
+once it is in the manifest, so they never pick up a half-written file.
+'''
+
+
+def tmp_name(file):
+    # per process and thread, so concurrent writers never write the same temp file
+    return file + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+
+
+@contextmanager
+def file_lock(lock_file):
+    # exclusive between threads and between processes that lock the same file
+    os.makedirs(os.path.dirname(lock_file) or '.', exist_ok=True)
+
+    with _thread_locks_lock:
+        thread_lock = _thread_locks.setdefault(lock_file, threading.Lock())
+
+    with thread_lock, open(lock_file, 'w') as f:
+        lock(f)
+        try:
+            yield
+        finally:
+            unlock(f)
+
+
+def lock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+
+    # msvcrt gives up after 10 attempts a second apart, so keep waiting
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def manifest_lock():
+    # serialises manifest updates between threads and between processes
+    return file_lock(manifest_lock_file)
+
+
+def read_manifest():
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            return json.load(f)
+
+    # store written before the manifest existed - publish whatever partitions are on disk
+    return {
+        'version': 0,
+        'datasets': {dataset: {d: {'rows': None} for d in scan_partitions(dataset)} for dataset in datasets}
+    }
+
+
+def write_manifest(manifest):
+    tmp = tmp_name(manifest_file)
+
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    os.replace(tmp, manifest_file)
+
+
+'''
+===================
+EXCEL IMPORT/EXPORT
+===================
+'''
+
+
+def import_excel(dataset, file=None, overwrite=False):
+    file = file or datasets[dataset]['excel']
+    df = normalise(dataset, pd.read_excel(file))
+
+    existing = set(list_dates(dataset))
+    written = 0
+
+    for d, dfx in df.groupby('date'):
+        if d in existing and not overwrite:
+            continue
+        write_partition(dataset, d, dfx)
+        written += 1
+
+    return written
+
+
+def export_excel(dataset, file=None):
+    file = file or datasets[dataset]['excel']
+    df = read_dataset(dataset)
+    df.to_excel(file, index=False, columns=datasets[dataset]['columns'])
+
+    return df.shape[0]
+
+
+def ensure_store():
+    # one-off migration: seed an empty store from the legacy excel files
+    for dataset in datasets:
+        if not list_dates(dataset) and os.path.exists(datasets[dataset]['excel']):
+            print('Seeding', dataset, 'store from', datasets[dataset]['excel'])
+            import_excel(dataset)
+
+
+if __name__ == '__main__':
+    # python covid_store.py import|export [daily|totals]
+    action = sys.argv[1] if len(sys.argv) > 1 else 'import'
+    names = sys.argv[2:] or list(datasets)
+
+    for name in names:
+        if action == 'import':
+            print(name, import_excel(name), 'partitions written')
+        elif action == 'export':
+            print(name, export_excel(name), 'rows exported to', datasets[name]['excel'])
+        else:
+            sys.exit('usage: python covid_store.py import|export [daily|totals]')
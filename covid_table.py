@@ -0,0 +1,179 @@
+import re
+import numpy as np
+import pandas as pd
+from figure_cache import FigureCache
+from covid_schema import float_values
+
+'''
+============================================
+SERVER-SIDE DATATABLE (PAGE / SORT / FILTER)
+============================================
+
+Backs a dash DataTable with page_action, sort_action and filter_action set to
+'custom'. The frame holds one contiguous block of rows per date (CovidIndex),
+already in the default order. Other sort orders are worked out per
+(date, column, direction) on first use and kept in an LRU, so a request costs a
+slice of one page plus, when filtering, one pass over the date's rows.
+'''
+
+# operators in the DataTable filter_query syntax, symbol -> name
+filter_operators = {
+    'ge': 'ge', '>=': 'ge',
+    'le': 'le', '<=': 'le',
+    'lt': 'lt', '<': 'lt',
+    'gt': 'gt', '>': 'gt',
+    'ne': 'ne', '!=': 'ne',
+    'eq': 'eq', '=': 'eq',
+    'contains': 'contains',
+    'datestartswith': 'datestartswith'
+}
+
+# the operator is only read straight after the closing '}', so values like "Castle Vale" are left alone
+operator_pattern = '|'.join(re.escape(op) for op in sorted(filter_operators, key=len, reverse=True))
+filter_part_pattern = re.compile(r'^\s*\{(.+?)\}\s*(' + operator_pattern + r')(?:(?<=[<>=])\s*|\s+)(.*)$', re.DOTALL)
+
+
+def split_filter_part(filter_part):
+    # '{col} op value' -> (col, op, value)
+    match = filter_part_pattern.match(filter_part)
+
+    if match is None:
+        return None, None, None
+
+    name, operator, value_part = match.groups()
+
+    value_part = value_part.strip()
+    v0 = value_part[0] if value_part else ''
+
+    if v0 == value_part[-1:] and v0 in ("'", '"', '`') and len(value_part) > 1:
+        value = value_part[1: -1].replace('\\' + v0, v0)
+    else:
+        try:
+            value = float(value_part)
+        except ValueError:
+            value = value_part
+
+    return name, filter_operators[operator], value
+
+
+def column_mask(s, operator, value):
+    # boolean mask over s; categorical columns are tested once per category, not per row
+    if pd.api.types.is_categorical_dtype(s):
+        categories = s.cat.categories.astype(str)
+        value = str(value)
+
+        if operator == 'contains':
+            hit = categories.str.contains(value, case=False, regex=False)
+        elif operator == 'datestartswith':
+            hit = categories.str.startswith(value)
+        elif operator == 'eq':
+            hit = categories == value
+        elif operator == 'ne':
+            hit = categories != value
+        else:
+            return np.ones(len(s), dtype=bool)
+
+        # code -1 (missing) picks the appended False
+        return np.append(np.asarray(hit), False)[s.cat.codes.values]
+
+    # a missing value matches nothing, as for a categorical column (not 'nan' as text, nor != value)
+    present = s.notna().values
+
+    if operator in ('contains', 'datestartswith'):
+        return s.astype(str).str.contains(str(value), case=False, regex=False).values & present
+
+    values = float_values(s)
+
+    if isinstance(value, str):
+        return np.zeros(len(s), dtype=bool)
+
+    with np.errstate(invalid='ignore'):
+        if operator == 'eq':
+            return values == value
+        if operator == 'ne':
+            return (values != value) & present
+        if operator == 'lt':
+            return values < value
+        if operator == 'le':
+            return values <= value
+        if operator == 'gt':
+            return values > value
+        if operator == 'ge':
+            return values >= value
+
+    return np.ones(len(s), dtype=bool)
+
+
+def filter_mask(df, filter_query):
+    # rows of df matching every '{col} op value' clause joined by ' && '
+    mask = np.ones(len(df), dtype=bool)
+
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, value = split_filter_part(filter_part)
+
+        if col_name in df.columns:
+            mask &= column_mask(df[col_name], operator, value)
+
+    return mask
+
+
+def sort_key(s):
+    # float values with missing as NaN (argsort puts them last)
+    if pd.api.types.is_categorical_dtype(s):
+        codes = s.cat.codes.values.astype('float64')
+        codes[codes < 0] = np.nan
+        return codes
+
+    return float_values(s)
+
+
+class TableIndex:
+
+    def __init__(self, df_index, table, max_orders=256):
+        self.df_index = df_index
+        self.table = table  # displayed columns, row-aligned with df_index.df
+        self._orders = FigureCache(max_items=max_orders, name='table_orders')
+
+    def order(self, d, sort_by=None):
+        # absolute row positions of date d in the requested order
+        rows = self.df_index.date_slice(d)
+
+        if not sort_by:
+            return np.arange(rows.start, rows.stop)
+
+        col = sort_by[0]['column_id']
+        ascending = sort_by[0]['direction'] == 'asc'
+        key = (d, col, ascending)
+
+        pos = self._orders.get(key)
+
+        if pos is None:
+            values = sort_key(self.table[col].iloc[rows])
+            if not ascending:
+                values = -values  # NaN stays NaN, so missing values stay last
+            pos = (rows.start + np.argsort(values, kind='mergesort')).astype(np.int32)
+            self._orders.put(key, pos)
+
+        return pos
+
+    def query(self, d, sort_by=None, keep=None, filter_query=''):
+        # positions of date d, ordered, restricted to keep (a mask over the date's rows) and filter_query
+        rows = self.df_index.date_slice(d)
+        pos = self.order(d, sort_by)
+
+        if filter_query:
+            mask = filter_mask(self.table.iloc[rows], filter_query)
+            keep = mask if keep is None else keep & mask
+
+        if keep is not None:
+            pos = pos[keep[pos - rows.start]]
+
+        return pos
+
+    def page(self, pos, page_current, page_size):
+        # records for one page of pos, and the page count
+        page_count = max(1, -(-len(pos) // page_size))
+        page_current = min(page_current or 0, page_count - 1)
+        start = page_current * page_size
+
+        return self.table.iloc[pos[start: start + page_size]].to_dict('records'), page_count
@@ -0,0 +1,90 @@
+import functools
+import threading
+from collections import OrderedDict
+
+'''
+====================================
+FIGURE CACHE (LRU, PER DATA VERSION)
+====================================
+
+Figures are cached as plain dicts keyed on the normalised callback inputs, so
+the same (date, authorities, daily/cumulative, cases/deaths) request from any
+user is served without rebuilding the go.Figure. The whole cache is dropped
+when the data version changes.
+'''
+
+lookup_listeners = []  # called with (cache name, hit) on every lookup, e.g. covid_metrics
+
+
+def normalise(value):
+    # multi-select dropdowns arrive as None, [] or a list in click order
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(sorted(set(value)))
+    return value
+
+
+class FigureCache:
+
+    def __init__(self, max_items=256, name='figures'):
+        self.max_items = max_items
+        self.name = name
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self.version:
+                self._items.clear()
+                self.version = version
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        for listener in lookup_listeners:
+            listener(self.name, value is not None)
+
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def memoize(self, name):
+        # goes underneath @app.callback so Dash registers the cached wrapper
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = (name, self.version) + tuple(normalise(a) for a in args)
+                value = self.get(key)
+
+                if value is None:
+                    value = func(*args)
+                    if hasattr(value, 'to_dict'):
+                        value = value.to_dict()
+                    self.put(key, value)
+
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._items), 'hits': self.hits, 'misses': self.misses, 'version': self.version}
@@ -0,0 +1,19 @@
+import covid_memory
+
+'''
+==============
+GUNICORN HOOKS
+==============
+
+Picked up automatically from the working directory by gunicorn. Data is loaded
+once in the master (--preload in Procfile) and each worker reports its memory
+after the fork; GET /memory on any worker gives the current figures.
+'''
+
+
+def when_ready(server):
+    covid_memory.log_memory('master ready')
+
+
+def post_fork(server, worker):
+    covid_memory.log_memory('worker ' + str(worker.age) + ' forked')
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import builtins
+from contextlib import contextmanager
+
+'''
+=======================
+START-UP TIME PROFILING
+=======================
+
+Import this module before anything else. With STARTUP_PROFILE=1 it times every
+top-level import and each start-up phase, prints a report once the app module
+has loaded (and again after a deferred data load), and reports the time to the
+first response against the target in STARTUP_BUDGET_SECONDS.
+'''
+
+started = time.time()
+enabled = os.environ.get('STARTUP_PROFILE', '') == '1'
+budget = float(os.environ.get('STARTUP_BUDGET_SECONDS', '10'))
+report_imports = 15  # slowest imports to list
+
+imports = []  # (module, seconds) for outermost imports only - nested imports are included in their parent
+phases = []  # (phase, seconds)
+_reported = None  # phases already reported, None before the first report
+
+_original_import = builtins.__import__
+_depth = 0
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+
+    top = name.partition('.')[0]
+
+    if level or top in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    t0 = time.time()
+    _depth += 1
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        if _depth == 0:
+            imports.append((top, time.time() - t0))
+
+
+if enabled:
+    builtins.__import__ = _timed_import
+
+
+@contextmanager
+def phase(name):
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        phases.append((name, time.time() - t0))
+
+
+def report(label):
+    # print the import/phase breakdown and stop timing imports; a later call
+    # (e.g. after a deferred data load) prints only the phases since the last one
+    global _reported
+
+    builtins.__import__ = _original_import
+
+    if not enabled:
+        return
+
+    first = _reported is None
+    new_phases = phases[_reported or 0:]
+
+    if not first and not new_phases:
+        return
+
+    _reported = len(phases)
+
+    print('Start-up profile:', label)
+
+    if first:
+        totals = {}
+        for name, secs in imports:
+            totals[name] = totals.get(name, 0) + secs
+
+        for name, secs in sorted(totals.items(), key=lambda x: -x[1])[:report_imports]:
+            print('  import {:<28} {:6.2f}s'.format(name, secs))
+
+    for name, secs in new_phases:
+        print('  phase  {:<28} {:6.2f}s'.format(name, secs))
+    print('  total since process start        {:6.2f}s'.format(time.time() - started))
+
+
+def watch_first_response(server):
+    # log time from process start to the first response served by this process
+    if not enabled:
+        return
+
+    state = {'done': False}
+
+    @server.after_request
+    def first_response(response):
+        if not state['done']:
+            state['done'] = True
+            secs = time.time() - started
+            print('[pid', str(os.getpid()) + '] first response after {:.2f}s (target {:.0f}s) - {}'.format(
+                secs, budget, 'OK' if secs <= budget else 'OVER BUDGET'))
+        return response
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import covid_store  # noqa: E402
+import covid_ingest  # noqa: E402
+import backfill  # noqa: E402
+
+'''
+=============================
+BACKFILL AGAINST A LOCAL STUB
+=============================
+
+A local HTTP server stands in for the GovUK API and answers each release date
+the way the real one can: data, an empty 200, a 204, a 404 and a body that is
+not csv, or a connection that stalls part way. The backfill has to load the
+good dates and report the others without stopping.
+'''
+
+header = 'date,areaType,areaCode,areaName,cumCasesByPublishDate,newCasesByPublishDate,' \
+         'newDeaths28DaysByPublishDate,cumDeaths28DaysByPublishDate\n'
+
+releases = {
+    '2022-01-01': (200, ''),  # release with no data
+    '2022-01-02': (204, ''),
+    '2022-01-03': (200, header + '2022-01-03,ltla,E08000019,Sheffield,100,10,2,1\n'
+                                 '2022-01-02,ltla,E08000019,Sheffield,90,9,1,1\n'),
+    '2022-01-04': (404, 'not found'),
+    '2022-01-05': (200, header + '2022-01-05,ltla,"E08000019\n'),  # unterminated quote
+}
+
+stalled = '2022-01-06'  # sends the header row, then nothing for stall_secs
+stall_secs = 3
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        release = query.get('release', [''])[0]
+
+        if release == stalled:
+            self.send_response(200)
+            self.send_header('Content-Length', '100000')
+            self.end_headers()
+            self.wfile.write(header.encode())
+            self.wfile.flush()
+            time.sleep(stall_secs)
+            return
+
+        status, body = releases.get(release, (404, ''))
+        body = body.encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        if status != 204:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 204:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield 'http://127.0.0.1:{}/v2/data?format=csv'.format(server.server_port)
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(repo_dir)  # lat_long.xlsx
+    monkeypatch.setattr(covid_store, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(covid_store, 'manifest_file', str(tmp_path / 'manifest.json'))
+    monkeypatch.setattr(covid_store, 'manifest_lock_file', str(tmp_path / '.manifest.lock'))
+
+    return tmp_path
+
+
+def test_backfill_reports_each_date(stub_url, data_dir):
+    res = backfill.backfill('2022-01-01', '2022-01-05', workers=3, retries=0, backoff=0,
+                            url_ltla=stub_url, url_uk=stub_url)
+
+    for dataset in ('daily', 'totals'):
+        assert res[(dataset, '2022-01-01')] == 'Not Available'
+        assert res[(dataset, '2022-01-02')] == 'Not Available'
+        assert res[(dataset, '2022-01-03')] == '1 rows'
+        assert res[(dataset, '2022-01-04')] == 'Not Available'
+        assert res[(dataset, '2022-01-05')].startswith('Failed')
+
+        assert covid_store.list_dates(dataset) == ['2022-01-03']
+
+    daily = covid_store.read_partition('daily', '2022-01-03')
+    assert daily['Latitude'].notna().all()  # geocoded from lat_long.xlsx
+
+
+def test_backfill_skips_loaded_dates(stub_url, data_dir):
+    backfill.backfill('2022-01-03', '2022-01-03', retries=0, url_ltla=stub_url, url_uk=stub_url)
+
+    assert backfill.backfill('2022-01-03', '2022-01-03', retries=0, url_ltla=stub_url, url_uk=stub_url) == {}
+
+
+def test_backfill_gives_up_on_a_stalled_release(stub_url, data_dir, monkeypatch):
+    monkeypatch.setattr(covid_ingest, 'timeout', 0.2)
+    t0 = time.time()
+
+    res = backfill.backfill(stalled, stalled, retries=1, backoff=0, url_ltla=stub_url, url_uk=stub_url)
+
+    assert time.time() - t0 < stall_secs
+    assert res[('daily', stalled)].startswith('Failed')
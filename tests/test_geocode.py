@@ -0,0 +1,79 @@
+import os
+import sys
+import urllib.request
+import pandas as pd
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import covid_geocode  # noqa: E402
+
+pytest.importorskip('bs4')
+pytest.importorskip('lxml')
+
+'''
+=====================================
+GEOCODE AGAINST A SAVED DOOGAL PAGE
+=====================================
+
+tests/fixtures/doogal.html is a cut-down copy of the doogal administrative
+areas page. It is parsed in place of the live page, so nothing here goes to
+the network or writes the cached gazetteer.
+'''
+
+fixture = os.path.join(repo_dir, 'tests', 'fixtures', 'doogal.html')
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError('network access in a test')
+
+    monkeypatch.setattr(urllib.request, 'urlopen', no_network)
+    monkeypatch.setattr(covid_geocode, 'gazetteer_file', str(tmp_path / 'gazetteer.csv'))
+
+    return tmp_path
+
+
+def test_parse_doogal_keeps_first_row_with_coordinates():
+    df = covid_geocode.parse_doogal(fixture)
+
+    assert list(df['areaName']) == ['Cornwall', 'Hackney', 'Na h-Eileanan Siar', 'Sheffield', 'Wycombe']
+    assert df.set_index('areaName').loc['Sheffield'].tolist() == [53.4035, -1.544]
+
+
+def test_load_gazetteer_from_a_saved_page(offline):
+    table = covid_geocode.load_gazetteer(source=fixture)
+
+    # GovUK names through the aliases, hard-coded coords over the page
+    assert table['Hackney and City of London'] == table['Hackney'] == (51.5456, -0.0554)
+    assert table['Cornwall and Isles of Scilly'] == table['Cornwall']
+    assert table['Comhairle nan Eilean Siar'] == table['Na h-Eileanan Siar']
+    assert table['Wycombe'] == (51.6635175, -0.9501978)
+    assert table['Chiltern'] == (51.6788424, -0.7737162)
+
+    assert not os.path.exists(covid_geocode.gazetteer_file)
+
+
+def test_load_gazetteer_writes_an_explicit_file(offline):
+    file = str(offline / 'fixture.csv')
+    covid_geocode.load_gazetteer(source=fixture, file=file)
+
+    assert pd.read_csv(file)['areaName'].tolist()[:2] == ['Cornwall', 'Hackney']
+    assert not os.path.exists(covid_geocode.gazetteer_file)
+
+
+def test_geocode_fills_from_the_given_gazetteer(offline):
+    df_load = pd.DataFrame({
+        'date': '2022-05-19',
+        'areaName': ['Leeds', 'Sheffield', 'Hackney and City of London', 'Nowhere']
+    })
+    lookup = {'Leeds': (53.8, -1.55)}
+
+    df, missing = covid_geocode.geocode(df_load, lookup, covid_geocode.load_gazetteer(source=fixture))
+
+    assert missing == ['Nowhere']
+    assert df['Latitude'].tolist()[:3] == [53.8, 53.4035, 51.5456]
+    assert pd.isna(df['Latitude'].iloc[3])
+    assert lookup['Sheffield'] == (53.4035, -1.544)  # found ones are added to the lookup
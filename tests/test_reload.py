@@ -0,0 +1,188 @@
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import covid_store  # noqa: E402
+import covid_snapshot  # noqa: E402
+from covid_dataset import LiveDataset  # noqa: E402
+from covid_rollup import Rollups  # noqa: E402
+
+'''
+===========================================
+INCREMENTAL RELOAD AGAINST A FRESH BUILD
+===========================================
+
+A reload that only adds later days extends what is already loaded: the
+snapshot gets the new partitions added to its rows, the rollups recompute
+only their latest periods. Each has to give exactly what building from
+scratch gives, including for an area that first appears in the new days.
+'''
+
+areas = ['Barnsley', 'Leeds', 'Sheffield', 'York']
+new_area = 'Harrogate'  # sorts between the existing areas
+
+
+def release(d, names, seed):
+    rng = np.random.RandomState(seed)
+    n = len(names)
+
+    return pd.DataFrame({
+        'date': d,
+        'areaType': 'ltla',
+        'areaCode': ['E0800{:04d}'.format(sorted(areas + [new_area]).index(a)) for a in names],
+        'areaName': names,
+        'cumCasesByPublishDate': rng.randint(1000, 2000, n),
+        'newCasesByPublishDate': rng.randint(0, 100, n),
+        'newDeaths28DaysByPublishDate': rng.randint(0, 5, n),
+        'cumDeaths28DaysByPublishDate': rng.randint(10, 20, n),
+        'Latitude': 53.5,
+        'Longitude': -1.5
+    })
+
+
+def history(days=120, new_area_from=None):
+    # daily releases from 2021-11-01, none at weekends from 2022, an area missing now and then
+    parts = []
+
+    for i, d in enumerate(pd.date_range('2021-11-01', periods=days, freq='D')):
+        if d.year >= 2022 and d.weekday() >= 5:
+            continue
+
+        names = [a for j, a in enumerate(areas) if (i + j) % 17]
+        if new_area_from is not None and i >= new_area_from:
+            names.append(new_area)
+
+        parts.append(release(d.strftime('%Y-%m-%d'), sorted(names), i))
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def assert_same_rollups(a, b):
+    assert a.days == b.days
+    assert a.calendar == b.calendar
+    assert sorted(a.areas) == sorted(b.areas)
+
+    names = sorted(b.areas)
+
+    for res, (x, m) in b.levels.items():
+        assert a.levels[res][0] == x
+        np.testing.assert_array_equal(a.levels[res][1][:, [a.areas[n] for n in names]], m[:, [b.areas[n] for n in names]])
+
+    for span in (7, 28, 400, None):
+        np.testing.assert_allclose(a.total(span)[2], b.total(span)[2])
+
+
+@pytest.mark.parametrize('new_days', [1, 3, 9, 40])
+def test_extended_rollups_match_a_fresh_build(new_days):
+    df = history(new_area_from=120 - new_days // 2 - 1)
+    dates = sorted(df['date'].unique())
+    start = int(df['date'].searchsorted(dates[-new_days]))
+
+    full = Rollups(df, 'newCasesByPublishDate', start='2021-11-01')
+    old = Rollups(df.iloc[:start], 'newCasesByPublishDate', start='2021-11-01')
+
+    # all at once, and a day at a time
+    assert_same_rollups(old.extended(df.iloc[start:]), full)
+
+    rollups = old
+    for d in dates[-new_days:]:
+        rollups = rollups.extended(df[df['date'] == d])
+    assert_same_rollups(rollups, full)
+
+    assert new_area in full.areas and new_area not in old.areas
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(covid_store, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(covid_store, 'manifest_file', str(tmp_path / 'manifest.json'))
+    monkeypatch.setattr(covid_store, 'manifest_lock_file', str(tmp_path / '.manifest.lock'))
+
+    snapshot_dir = tmp_path / 'snapshot'
+    monkeypatch.setattr(covid_snapshot, 'snapshot_dir', str(snapshot_dir))
+    monkeypatch.setattr(covid_snapshot, 'manifest_file', str(snapshot_dir / 'snapshot.json'))
+    monkeypatch.setattr(covid_snapshot, 'lock_file', str(snapshot_dir / '.snapshot.lock'))
+
+    return tmp_path
+
+
+def write_days(df, dates):
+    for d in dates:
+        for dataset in covid_store.datasets:
+            covid_store.write_partition(dataset, d, df[df['date'] == d])
+
+
+def fresh_snapshot(dataset):
+    os.remove(covid_snapshot.manifest_file)
+    return covid_snapshot.load_snapshot(dataset)
+
+
+def test_appended_snapshot_matches_a_fresh_build(data_dir, monkeypatch):
+    df = history(days=30, new_area_from=28)
+    dates = sorted(df['date'].unique())
+
+    write_days(df, dates[:-2])
+    covid_snapshot.load_snapshot('daily')
+    write_days(df, dates[-2:])
+
+    # only the new partitions are read
+    read = []
+    read_frame = covid_snapshot.read_frame
+    monkeypatch.setattr(covid_snapshot, 'read_frame', lambda dataset, ds: read.append(ds) or read_frame(dataset, ds))
+
+    appended = covid_snapshot.load_snapshot('daily')
+    assert read == [dates[-2:], dates[-2:]]
+
+    monkeypatch.setattr(covid_snapshot, 'read_frame', read_frame)
+    pd.testing.assert_frame_equal(appended, fresh_snapshot('daily'))
+    assert new_area in set(appended['areaName'])
+
+
+def test_rewritten_partition_rebuilds_the_snapshot(data_dir):
+    df = history(days=10)
+    dates = sorted(df['date'].unique())
+
+    write_days(df, dates)
+    covid_snapshot.load_snapshot('daily')
+
+    rewritten = df[df['date'] == dates[3]].assign(newCasesByPublishDate=12345)
+    covid_store.write_partition('daily', dates[3], rewritten)
+
+    snap = covid_snapshot.load_snapshot('daily')
+    assert (snap.loc[snap['date'] == dates[3], 'newCasesByPublishDate'] == 12345).all()
+    pd.testing.assert_frame_equal(snap, fresh_snapshot('daily'))
+
+
+def test_refresh_extends_only_when_days_were_appended(data_dir):
+    df = history(days=20, new_area_from=19)
+    dates = sorted(df['date'].unique())
+
+    def build(frames, version):
+        return SimpleNamespace(version=version, frames=frames, how='build')
+
+    def extend(current, frames, version, start):
+        return SimpleNamespace(version=version, frames=frames, how='extend', start=start)
+
+    write_days(df, dates[:-3] + dates[-2:])
+    live = LiveDataset(build, extend=extend)
+    live.load()
+
+    # a day before the last one loaded: rebuilt
+    write_days(df, dates[-3:-2])
+    assert live.refresh(force=True)
+    assert live.current.how == 'build'
+
+    # a later day: extended from the rows already loaded
+    rows = {ds: len(f) for ds, f in live.current.frames.items()}
+    more = history(days=21, new_area_from=19)
+    write_days(more, sorted(more['date'].unique())[-1:])
+    assert live.refresh(force=True)
+
+    assert live.current.how == 'extend'
+    assert live.current.start == rows
@@ -0,0 +1,79 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from covid_table import split_filter_part, filter_mask  # noqa: E402
+
+'''
+==========================
+DATATABLE FILTER QUERIES
+==========================
+
+filter_query strings as the MSOA DataTable sends them, '{column} op value'
+clauses joined by ' && ', parsed and applied to a small frame with a
+categorical column, a text column and a numeric column, each with a gap.
+'''
+
+
+@pytest.mark.parametrize('filter_part, expected', [
+    ('{areaName} = Sheffield', ('areaName', 'eq', 'Sheffield')),
+    ('{areaName} eq "Lee Bank"', ('areaName', 'eq', 'Lee Bank')),
+    ('{newCases} >= 100', ('newCases', 'ge', 100.0)),
+    ('{newCases}>=100', ('newCases', 'ge', 100.0)),
+    ('{newCases} ge 100', ('newCases', 'ge', 100.0)),
+    ('{newCases} < 5.5', ('newCases', 'lt', 5.5)),
+    ('{newCases} != 0', ('newCases', 'ne', 0.0)),
+    ('{areaName} contains vale', ('areaName', 'contains', 'vale')),
+    ('{areaName} contains Castle Vale', ('areaName', 'contains', 'Castle Vale')),
+    ('{areaName} contains "Castle Vale"', ('areaName', 'contains', 'Castle Vale')),
+    ("{areaName} contains 'Castle Vale'", ('areaName', 'contains', 'Castle Vale')),
+    ('{areaName} contains "Castle \\"Vale\\""', ('areaName', 'contains', 'Castle "Vale"')),
+    # operator words and symbols inside the value are part of the value
+    ('{areaName} = Castle Vale ge 5', ('areaName', 'eq', 'Castle Vale ge 5')),
+    ('{areaName} contains Newcastle-under-Lyme', ('areaName', 'contains', 'Newcastle-under-Lyme')),
+    ('{areaName} contains "a = b"', ('areaName', 'contains', 'a = b')),
+    ('{date} datestartswith 2022-05', ('date', 'datestartswith', '2022-05')),
+    # not a clause
+    ('Sheffield', (None, None, None)),
+    ('{areaName} Sheffield', (None, None, None)),
+    ('', (None, None, None)),
+])
+def test_split_filter_part(filter_part, expected):
+    assert split_filter_part(filter_part) == expected
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'areaName': pd.Categorical(['Castle Vale', 'Lee Bank', 'Sheffield Central', None]),
+        'LtlaName': ['Birmingham', 'Birmingham', None, 'Sheffield'],
+        'newCases': [10, 250, np.nan, 40]
+    })
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('', [True, True, True, True]),
+    ('{areaName} contains vale', [True, False, False, False]),
+    ('{areaName} contains "Castle Vale"', [True, False, False, False]),
+    ('{areaName} = "Lee Bank"', [False, True, False, False]),
+    ('{areaName} ne "Lee Bank"', [True, False, True, False]),
+    ('{LtlaName} contains ham', [True, True, False, False]),
+    ('{LtlaName} contains on', [False, False, False, False]),  # not 'None'
+    ('{newCases} >= 40', [False, True, False, True]),
+    ('{newCases} < 40', [True, False, False, False]),
+    ('{newCases} = 250', [False, True, False, False]),
+    ('{newCases} ne 10', [False, True, False, True]),
+    ('{newCases} contains na', [False, False, False, False]),  # not 'nan'
+    ('{newCases} > Castle', [False, False, False, False]),
+    ('{areaName} contains a && {newCases} >= 40', [False, True, False, False]),
+    # unknown columns and unparseable clauses are ignored
+    ('{nothing} = 1', [True, True, True, True]),
+    ('Castle Vale && {newCases} < 40', [True, False, False, False]),
+])
+def test_filter_mask(df, filter_query, expected):
+    assert filter_mask(df, filter_query).tolist() == expected